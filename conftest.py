@@ -12,6 +12,15 @@ def pytest_sessionstart(session):
     )
     os.environ["NUMBA_BOUNDSCHECK"] = "1"
 
+    # Give each pytest-xdist worker its own compiledir, so that workers don't
+    # serialize on the compiledir lock
+    worker = os.environ.get("PYTEST_XDIST_WORKER")
+    if worker and "compiledir" not in os.environ["PYTENSOR_FLAGS"]:
+        os.environ["PYTENSOR_FLAGS"] += (
+            ",compiledir_format=compiledir_%(short_platform)s-%(processor)s-"
+            f"%(python_version)s-%(python_bitwidth)s-{worker}"
+        )
+
 
 def pytest_addoption(parser):
     parser.addoption(
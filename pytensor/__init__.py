@@ -128,7 +128,12 @@ from pytensor.compile import (
     predefined_optimizers,
     shared,
 )
-from pytensor.compile.function import function, function_dump
+from pytensor.compile.function import (
+    function,
+    function_dump,
+    function_load,
+    function_precompile,
+)
 from pytensor.compile.function.types import FunctionMaker
 from pytensor.gradient import Lop, Rop, grad, subgraph_grad
 from pytensor.printing import debugprint as dprint
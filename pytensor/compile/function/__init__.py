@@ -1,14 +1,21 @@
 import logging
+import mmap
+import pickle
 import re
-import traceback as tb
+import struct
+import sys
+from collections import OrderedDict
 from collections.abc import Iterable
+from itertools import repeat
 from pathlib import Path
+from typing import Any, NamedTuple
 
 import pytensor.misc.pkl_utils
 from pytensor.compile.function.pfunc import pfunc
-from pytensor.compile.function.types import orig_function
+from pytensor.compile.function.types import Function, orig_function
 from pytensor.compile.mode import Mode
 from pytensor.compile.profiling import ProfileStats
+from pytensor.configdefaults import config
 from pytensor.graph import Variable
 
 
@@ -17,6 +24,47 @@ __all__ = ["types", "pfunc"]
 __docformat__ = "restructuredtext en"
 _logger = logging.getLogger("pytensor.compile.function")
 
+# Possible file names of this module, used to skip its frames when deriving
+# a default function name from the caller's location
+_SOURCE_FILE = re.sub(r"\.pyc?", ".py", __file__)
+_COMPILED_FILE = _SOURCE_FILE + "c"
+
+# Bound once, instead of building a `list | tuple` union on every isinstance check
+_LIST_TUPLE = (list, tuple)
+
+# Write buffer size of `function_dump`, large enough to avoid issuing many small
+# write calls when pickling big shared variables
+_DUMP_BUFFER_SIZE = 1 << 22
+
+# Out-of-band buffers of `function_dump` are aligned to this many bytes
+_BUFFER_ALIGNMENT = 64
+
+# LRU cache of compiled functions, see `config.compile__function_cache_size`
+_compile_cache: OrderedDict[tuple, Function] = OrderedDict()
+
+
+def _freeze(x):
+    """Convert nested lists, tuples and dicts of arguments to hashable tuples."""
+    if isinstance(x, dict):
+        return (dict, tuple((k, _freeze(v)) for k, v in x.items()))
+    if isinstance(x, _LIST_TUPLE):
+        return (type(x), tuple(_freeze(v) for v in x))
+    return x
+
+
+def _compile_cache_key(*args) -> tuple | None:
+    """Return a key identifying a call to `function`, or None if it can't be hashed.
+
+    Variables are compared by identity, so the key only matches calls that use the
+    very same graph objects.
+    """
+    key = tuple(_freeze(arg) for arg in args)
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
 
 def function_dump(
     filename: str | Path,
@@ -38,6 +86,7 @@ def function_dump(
     on_unused_input: str | None = None,
     extra_tag_to_remove: str | None = None,
     trust_input: bool = False,
+    out_of_band: bool = False,
 ):
     """
     This is helpful to make a reproducible case for problems during PyTensor
@@ -69,6 +118,16 @@ def function_dump(
     To pickle graph made by Blocks, it must be:
     `['annotations', 'replacement_of', 'aggregation_scheme', 'roles']`
 
+    If `out_of_band` is True, the data of large arrays (like the values of
+    shared variables) is not copied into the pickle stream, but written
+    as-is to a ``filename + ".buffers"`` sidecar file using pickle protocol 5.
+    Such a dump must be loaded with `load_function_dump`, which memory-maps
+    the sidecar file instead of reading the arrays into memory:
+
+    >>> from pytensor.compile.function import load_function_dump
+    >>> d = load_function_dump("func_dump.bin")  # doctest: +SKIP
+    >>> f = pytensor.function(**d)  # doctest: +SKIP
+
     """
     d = {
         "inputs": inputs,
@@ -85,12 +144,139 @@ def function_dump(
         "on_unused_input": on_unused_input,
         "trust_input": trust_input,
     }
-    with Path(filename).open("wb") as f:
-        pickler = pytensor.misc.pkl_utils.StripPickler(
-            f, protocol=-1, extra_tag_to_remove=extra_tag_to_remove
-        )
+    buffers: list[pickle.PickleBuffer] = []
+    with Path(filename).open("wb", buffering=_DUMP_BUFFER_SIZE) as f:
+        if out_of_band:
+            pickler = pytensor.misc.pkl_utils.StripPickler(
+                f,
+                protocol=5,
+                extra_tag_to_remove=extra_tag_to_remove,
+                buffer_callback=buffers.append,
+            )
+        else:
+            pickler = pytensor.misc.pkl_utils.StripPickler(
+                f, protocol=-1, extra_tag_to_remove=extra_tag_to_remove
+            )
         pickler.dump(d)
 
+    if out_of_band:
+        _write_pickle_buffers(_buffers_path(filename), buffers)
+
+
+def _buffers_path(filename: str | Path) -> Path:
+    filename = Path(filename)
+    return filename.with_name(filename.name + ".buffers")
+
+
+def _write_pickle_buffers(path: Path, buffers: list[pickle.PickleBuffer]) -> None:
+    """Write out-of-band pickle buffers contiguously, after a header with their sizes."""
+    raws = [buffer.raw() for buffer in buffers]
+    header = struct.pack(f"<{len(raws) + 1}Q", len(raws), *(r.nbytes for r in raws))
+    with path.open("wb", buffering=_DUMP_BUFFER_SIZE) as f:
+        f.write(header)
+        offset = len(header)
+        for raw in raws:
+            padding = -offset % _BUFFER_ALIGNMENT
+            f.write(bytes(padding))
+            f.write(raw)
+            offset += padding + raw.nbytes
+
+
+def _read_pickle_buffers(path: Path) -> list[memoryview]:
+    """Memory-map a file written by `_write_pickle_buffers` and return views of its buffers."""
+    with path.open("rb") as f:
+        # Copy-on-write, so that the loaded arrays remain writeable
+        data = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY))
+    (n_buffers,) = struct.unpack_from("<Q", data)
+    sizes = struct.unpack_from(f"<{n_buffers}Q", data, 8)
+    offset = 8 * (n_buffers + 1)
+    buffers = []
+    for size in sizes:
+        offset += -offset % _BUFFER_ALIGNMENT
+        buffers.append(data[offset : offset + size])
+        offset += size
+    return buffers
+
+
+def load_function_dump(filename: str | Path) -> dict:
+    """Load the arguments saved by `function_dump`.
+
+    The arrays of a dump made with ``out_of_band=True`` are memory-mapped from
+    its sidecar file instead of being copied.
+
+    Returns
+    -------
+    dict
+        Keyword arguments that can be passed to `function`.
+    """
+    return _load_pickle(filename)
+
+
+def _load_pickle(filename: str | Path):
+    """Unpickle `filename`, with the out-of-band buffers of its sidecar file if any."""
+    buffers_path = _buffers_path(filename)
+    buffers = _read_pickle_buffers(buffers_path) if buffers_path.exists() else None
+    with Path(filename).open("rb") as f:
+        return pickle.load(f, buffers=buffers)
+
+
+def function_precompile(
+    filename: str | Path,
+    inputs: Iterable[Variable],
+    outputs: Variable | Iterable[Variable] | dict[str, Variable] | None = None,
+    out_of_band: bool = False,
+    **kwargs,
+) -> Function:
+    """Compile a function and save it to disk, so that it can be reloaded with `function_load`.
+
+    The saved function contains the rewritten graph, so loading it skips the
+    graph rewrites done by `function`, which can take most of the compilation
+    time of large graphs. C code is still compiled when loading, but it is
+    normally found in the compilation cache.
+
+    >>> f = pytensor.function_precompile("f.pkl", [x], y)  # doctest: +SKIP
+    >>> # Later, or in another process
+    >>> f = pytensor.function_load("f.pkl")  # doctest: +SKIP
+
+    Parameters
+    ----------
+    filename
+        File in which the compiled function is saved.
+    inputs, outputs
+        Same as in `function`.
+    out_of_band
+        Save the data of large arrays (e.g. the values of shared variables) to a
+        ``filename + ".buffers"`` sidecar file, as in `function_dump`.
+    kwargs
+        Other arguments passed to `function`.
+
+    Returns
+    -------
+    :class:`pytensor.compile.function.types.Function`
+        The compiled function.
+    """
+    fn = function(inputs, outputs, **kwargs)
+    buffers: list[pickle.PickleBuffer] = []
+    with Path(filename).open("wb", buffering=_DUMP_BUFFER_SIZE) as f:
+        if out_of_band:
+            pickle.dump(fn, f, protocol=5, buffer_callback=buffers.append)
+        else:
+            pickle.dump(fn, f, protocol=-1)
+
+    if out_of_band:
+        _write_pickle_buffers(_buffers_path(filename), buffers)
+    return fn
+
+
+def function_load(filename: str | Path) -> Function:
+    """Load a function saved by `function_precompile`, without rewriting its graph again."""
+    fn = _load_pickle(filename)
+    if fn is None:
+        raise ValueError(
+            "Functions can't be loaded when config.unpickle_function is False"
+        )
+    return fn
+
 
 def function(
     inputs: Iterable[Variable],
@@ -121,6 +307,7 @@ def function(
         Function parameters, these are not allowed to be shared variables.
     outputs : list or dict of Variables or Out instances.
         If it is a dict, the keys must be strings. Expressions to compute.
+        The outputs of a dict are computed and returned in its insertion order.
     mode : string or `Mode` instance.
         Compilation mode.
     updates : iterable over pairs (shared_variable, new_expression). List, tuple
@@ -189,160 +376,185 @@ def function(
     from optimizations in that Var2 is not expected to be
     equivalent to Var1.
 
+    """
+    args = _normalize_function_args(
+        inputs,
+        outputs,
+        mode=mode,
+        updates=updates,
+        givens=givens,
+        no_default_updates=no_default_updates,
+        accept_inplace=accept_inplace,
+        name=name,
+        rebuild_strict=rebuild_strict,
+        allow_input_downcast=allow_input_downcast,
+        profile=profile,
+        on_unused_input=on_unused_input,
+        trust_input=trust_input,
+    )
+    return _function_impl(args)
+
+
+class _FunctionArgs(NamedTuple):
+    """Normalized arguments of `function`."""
+
+    inputs: list | tuple
+    outputs: Any
+    output_keys: list[str] | None
+    mode: str | Mode | None
+    updates: Any
+    givens: Any
+    no_default_updates: bool | list
+    accept_inplace: bool
+    name: str | None
+    rebuild_strict: bool
+    allow_input_downcast: bool | None
+    profile: bool | ProfileStats | None
+    on_unused_input: str | None
+    trust_input: bool
+    uses_tuple: bool
+
+    def cache_key(self) -> tuple | None:
+        """Key of these arguments in the compile cache, or None if they can't be cached."""
+        if self.uses_tuple or self.profile:
+            return None
+        return _compile_cache_key(
+            self.inputs,
+            self.outputs,
+            self.output_keys,
+            self.mode,
+            self.updates,
+            self.givens,
+            self.no_default_updates,
+            self.accept_inplace,
+            self.rebuild_strict,
+            self.allow_input_downcast,
+            self.on_unused_input,
+            self.trust_input,
+        )
 
-    Internal documentation:
-
-        What happens when you call pytensor.function?
-           1. RemoveShared: shared variables are just an abstraction to make
-        things more convenient for the user. The shared variables are
-        transformed into implicit inputs and implicit outputs. The
-        optimizations don't see which variables are shared or not.
-           2. FunctionGraph: determines whether a graph is valid. For example,
-        suppose
-        you merge the two apply nodes in our example above, ie, do the
-        addition and the tanh at the same time. If you propose a merge that
-        changes the resulting dtype or broadcastable pattern of V4, the fgraph
-        will detect this.
-                    inplace optimizations: say we have an apply node that
-        does + on V1 and V2, with output V3. We can change the output to be
-        V1, to use less memory. pytensor must be told that this optimization is
-        happening though, so that other parts of the graph are given the
-        correct (pre + or post + ) version of V1.
-                  fgraph will raise an error if any of these types of
-        modifications causes an error
-                  fgraph also adds a field called "clients" to all variables.
-        clients is a list of apply nodes that use the variable. this makes it
-        possible to traverse the graph in both directions. this is useful for
-        determining whether to do some optimizations. for example, a fusion
-        operation that removes V3 is not very helpful if V3 is also needed for
-        some other apply node. fusion operations result in a composite op that
-        takes a minigraph of pytensor scalars and uses this to do elemwise
-        operations on pytensor tensors
-         3. Optimization
-               How well do optimizations apply to new ops?
-                 Usually there are no optimizations for new ops. In fact, new
-        ops can disrupt patterns and break currently working optimizations.
-        Since the Print op, for example, is not known by any optimization,
-        setting a Print op in the middle of a pattern that is usually
-        optimized out will block the optimization. for example, log(1+x)
-        optimizes to log1p(x) but log(1+Print(x)) is unaffected by
-        optimizations.
-                 One exception is elemwise ops. If you implement your new op
-        as a scalar op then it will automatically work with all the elemwise
-        fusion machinery.
-
-                 Local optimizations try to replace some node in the graph
-        with a different node. In the case of log(1+x), we want to replace the
-        log node.
-
-                 def opt_log1p(node):
-                    if not isinstance(node.op,Elemwise):
-                       return
-                    if not isinstance(node.op.scalar_op, log):
-                       return
-                    inp = node.inputs[0]
-                    if inp.owner is None:
-                       return
-                    if not isinstance(inp.owner.op, add):
-                       return
-                    inp2 = inp.owner.inputs
-                    check that this has length 2, and that one of the inputs
-        is 1. assign the other input to x
-                    return log1p(x)
-
-
-         4. Linker
-               The linker uses a Python loop to execute the code associated
-               with all the Apply nodes in the graph in the correct order.
-               The C Virtual Machine (CVM) is a linker that replaces this
-               Python loop with a C loop to avoid continuously changing
-               between Python and C. The CVM is faster for 2 reasons:
-                 1) Its internal logic is in C, so no Python interpreter
-                    overhead.
-                 2) It makes native calls from the VM logic into thunks that
-                    have been compiled using the CLinker.
-               The VM is a linker that was developed to prototype the CVM. it
-        was easier to develop the VM in Python then translate it to C instead
-        of just writing it in C from scratch.
 
-    """
+def _normalize_function_args(
+    inputs,
+    outputs,
+    mode,
+    updates,
+    givens,
+    no_default_updates,
+    accept_inplace,
+    name,
+    rebuild_strict,
+    allow_input_downcast,
+    profile,
+    on_unused_input,
+    trust_input,
+) -> _FunctionArgs:
+    """Validate the arguments of `function` and bring them to a canonical form."""
+    # Single pass over the inputs, done first so that bad inputs fail early
+    if not isinstance(inputs, _LIST_TUPLE):
+        raise TypeError(
+            "Input variables of a PyTensor function should be "
+            "contained in a list, even when there is a single "
+            "input."
+        )
+    # map with builtin isinstance keeps the short-circuiting scan in C
+    uses_tuple = any(map(isinstance, inputs, repeat(_LIST_TUPLE)))
+
     if isinstance(outputs, dict):
-        assert all(isinstance(k, str) for k in outputs)
+        if not all(isinstance(k, str) for k in outputs):
+            raise TypeError("The keys of the outputs dict must be strings")
 
-        output_keys = sorted(outputs)
-        outputs = [outputs[key] for key in output_keys]
+        # Outputs are kept in the insertion order of the dict
+        output_keys = list(outputs)
+        outputs = list(outputs.values())
 
     else:
         output_keys = None
 
     if name is None:
-        # Determine possible file names
-        source_file = re.sub(r"\.pyc?", ".py", __file__)
-        compiled_file = source_file + "c"
-
-        stack = tb.extract_stack()
-        idx = len(stack) - 1
-
-        last_frame = stack[idx]
-        if last_frame[0] == source_file or last_frame[0] == compiled_file:
-            func_frame = stack[idx - 1]
-            while "pytensor/graph" in func_frame[0] and idx > 0:
-                idx -= 1
-                # This can happen if we call var.eval()
-                func_frame = stack[idx - 1]
-            name = func_frame[0] + ":" + str(func_frame[1])
+        # Walk up the stack until we leave this module and `pytensor.graph`.
+        # The latter can happen if we call var.eval()
+        frame = sys._getframe(1)
+        while frame.f_back is not None and (
+            "pytensor/graph" in frame.f_code.co_filename
+            or frame.f_code.co_filename in (_SOURCE_FILE, _COMPILED_FILE)
+        ):
+            frame = frame.f_back
+        name = f"{frame.f_code.co_filename}:{frame.f_lineno}"
 
     if updates is None:
         updates = []
 
     if givens is None:
         givens = []
-    if not isinstance(inputs, list | tuple):
-        raise Exception(
-            "Input variables of an PyTensor function should be "
-            "contained in a list, even when there is a single "
-            "input."
-        )
-
-    # compute some features of the arguments:
-    uses_tuple = any(isinstance(i, list | tuple) for i in inputs)
-    uses_updates = bool(updates)
-    uses_givens = bool(givens)
 
     if uses_tuple:
         # we must use old semantics in this case.
         if profile:
             raise NotImplementedError("profiling not supported in old-style function")
-        if uses_updates or uses_givens:
+        if updates or givens:
             raise NotImplementedError(
                 "In() instances and tuple inputs trigger the old "
                 "semantics, which disallow using updates and givens"
             )
-        fn = orig_function(
-            inputs,
-            outputs,
-            mode=mode,
-            accept_inplace=accept_inplace,
-            name=name,
-            trust_input=trust_input,
-        )
-    else:
-        # note: pfunc will also call orig_function -- orig_function is
-        #      a choke point that all compilation must pass through
-        fn = pfunc(
-            params=inputs,
-            outputs=outputs,
-            mode=mode,
-            updates=updates,
-            givens=givens,
-            no_default_updates=no_default_updates,
-            accept_inplace=accept_inplace,
-            name=name,
-            rebuild_strict=rebuild_strict,
-            allow_input_downcast=allow_input_downcast,
-            on_unused_input=on_unused_input,
-            profile=profile,
-            output_keys=output_keys,
-            trust_input=trust_input,
+
+    return _FunctionArgs(
+        inputs=inputs,
+        outputs=outputs,
+        output_keys=output_keys,
+        mode=mode,
+        updates=updates,
+        givens=givens,
+        no_default_updates=no_default_updates,
+        accept_inplace=accept_inplace,
+        name=name,
+        rebuild_strict=rebuild_strict,
+        allow_input_downcast=allow_input_downcast,
+        profile=profile,
+        on_unused_input=on_unused_input,
+        trust_input=trust_input,
+        uses_tuple=uses_tuple,
+    )
+
+
+def _function_impl(args: _FunctionArgs) -> Function:
+    """Compile a function from normalized arguments, going through the compile cache."""
+    if args.uses_tuple:
+        return orig_function(
+            args.inputs,
+            args.outputs,
+            mode=args.mode,
+            accept_inplace=args.accept_inplace,
+            name=args.name,
+            trust_input=args.trust_input,
         )
+
+    cache_size = config.compile__function_cache_size
+    cache_key = args.cache_key() if cache_size else None
+    if cache_key is not None and cache_key in _compile_cache:
+        _compile_cache.move_to_end(cache_key)
+        return _compile_cache[cache_key].copy(name=args.name)
+
+    # note: pfunc will also call orig_function -- orig_function is
+    #      a choke point that all compilation must pass through
+    fn = pfunc(
+        params=args.inputs,
+        outputs=args.outputs,
+        mode=args.mode,
+        updates=args.updates,
+        givens=args.givens,
+        no_default_updates=args.no_default_updates,
+        accept_inplace=args.accept_inplace,
+        name=args.name,
+        rebuild_strict=args.rebuild_strict,
+        allow_input_downcast=args.allow_input_downcast,
+        on_unused_input=args.on_unused_input,
+        profile=args.profile,
+        output_keys=args.output_keys,
+        trust_input=args.trust_input,
+    )
+    if cache_key is not None:
+        _compile_cache[cache_key] = fn
+        while len(_compile_cache) > cache_size:
+            _compile_cache.popitem(last=False)
     return fn
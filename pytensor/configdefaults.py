@@ -531,6 +531,16 @@ def add_compile_configvars():
         in_c_key=False,
     )
 
+    config.add(
+        "compile__function_cache_size",
+        """Maximum number of compiled functions kept in the in-memory cache of
+    `pytensor.function`. Calls with the same inputs, outputs and arguments
+    return a copy of the cached function instead of rewriting the graph again.
+    0 disables the cache.""",
+        IntParam(0, validate=_is_greater_or_equal_0),
+        in_c_key=False,
+    )
+
 
 def _is_valid_cmp_sloppy(v):
     return v in (0, 1, 2)
@@ -94,6 +94,7 @@ class PyTensorConfigParser:
     cmodule__debug: bool
     compile__wait: int
     compile__timeout: int
+    compile__function_cache_size: int
     # add_tensor_configvars
     tensor__cmp_sloppy: int
     lib__amdlibm: bool
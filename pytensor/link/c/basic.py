@@ -1925,7 +1925,7 @@ class DualLinker(Linker):
 
     """
 
-    def __init__(self, checker=_default_checker, schedule=None):
+    def __init__(self, checker=_default_checker, schedule=None, check_once=False):
         """
         Initialize a DualLinker.
 
@@ -1948,9 +1948,14 @@ class DualLinker(Linker):
         If a Variable is in no_recycling, CLinker will clear the output storage
         associated to it during the computation (to avoid reusing it).
 
+        If check_once is True, the two implementations are only run and
+        compared on the first successful call of the function. Later calls
+        only run the C implementation.
+
         """
         self.fgraph = None
         self.checker = checker
+        self.check_once = check_once
         super().__init__(scheduler=schedule)
 
     def accept(self, fgraph, no_recycling=None, profile=None):
@@ -1960,7 +1965,7 @@ class DualLinker(Linker):
         if no_recycling is None:
             no_recycling = []
         if self.fgraph is not None and self.fgraph is not fgraph:
-            return type(self)(self.checker, self.schedule).accept(
+            return type(self)(self.checker, self.schedule, self.check_once).accept(
                 fgraph, no_recycling, profile
             )
         self.fgraph = fgraph
@@ -1987,7 +1992,26 @@ class DualLinker(Linker):
             .make_all(**kwargs)
         )
 
+        validated = False
+
+        def f_c_only():
+            for input1, input2 in zip(i1, i2):
+                input2.storage[0] = input1.storage[0]
+            for thunk2, node2 in zip(thunks2, order2):
+                for output, storage in zip(node2.outputs, thunk2.outputs):
+                    if output in no_recycling:
+                        storage[0] = None
+                try:
+                    thunk2()
+                except Exception:
+                    raise_with_op(fgraph, node2)
+            for output1, output2 in zip(o1, o2):
+                output1.storage[0] = output2.storage[0]
+
         def f():
+            nonlocal validated
+            if validated:
+                return f_c_only()
             # zip strict not specified because we are in a hot loop
             for input1, input2 in zip(i1, i2):
                 # Set the inputs to be the same in both branches.
@@ -2008,6 +2032,7 @@ class DualLinker(Linker):
                         self.checker(output1, output2)
                 except Exception:
                     raise_with_op(fgraph, node1)
+            validated = self.check_once
 
         return f, i1, o1
 
@@ -12,6 +12,7 @@ import pytensor.link.numba.dispatch.scalar
 import pytensor.link.numba.dispatch.signal
 import pytensor.link.numba.dispatch.slinalg
 import pytensor.link.numba.dispatch.sparse
+import pytensor.link.numba.dispatch.sparse_ops
 import pytensor.link.numba.dispatch.subtensor
 import pytensor.link.numba.dispatch.tensor_basic
 
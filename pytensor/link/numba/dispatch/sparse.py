@@ -204,3 +204,43 @@ def overload_sparse_copy(inst):
         )
 
     return copy
+
+
+@intrinsic
+def _sparse_from_arrays(typingctx, inst, data, indices, indptr, shape):
+    # Like `_sparse_copy`, but the result takes the dtype of `data`
+    def _construct(context, builder, sig, args):
+        typ = sig.return_type
+        struct = cgutils.create_struct_proxy(typ)(context, builder)
+        _, data, indices, indptr, shape = args
+        struct.data = data
+        struct.indices = indices
+        struct.indptr = indptr
+        struct.shape = shape
+        return impl_ret_borrowed(
+            context,
+            builder,
+            sig.return_type,
+            struct._getvalue(),
+        )
+
+    sig = type(inst)(data.dtype)(inst, data, indices, indptr, shape)
+
+    return sig, _construct
+
+
+@overload_method(CSMatrixType, "astype")
+def overload_sparse_astype(inst, dtype):
+    if not isinstance(inst, CSMatrixType):
+        return
+
+    def astype(inst, dtype):
+        return _sparse_from_arrays(
+            inst,
+            inst.data.astype(dtype),
+            inst.indices.copy(),
+            inst.indptr.copy(),
+            inst.shape,
+        )
+
+    return astype
@@ -0,0 +1,207 @@
+import numpy as np
+
+from pytensor.link.numba.dispatch import basic as numba_basic
+from pytensor.link.numba.dispatch.basic import generate_fallback_impl, numba_funcify
+from pytensor.sparse.basic import (
+    ColScaleCSC,
+    ColScaleCSR,
+    CSMGrad,
+    GetItem2Lists,
+    MulSD,
+    RowScaleCSC,
+    RowScaleCSR,
+    StructuredDotGradCSC,
+    StructuredDotGradCSR,
+)
+from pytensor.tensor.type import TensorType
+
+
+@numba_funcify.register(CSMGrad)
+def numba_funcify_CSMGrad(op, node, **kwargs):
+    @numba_basic.numba_njit(boundscheck=False)
+    def csm_grad(
+        x_data, x_indices, x_indptr, x_shape, g_data, g_indices, g_indptr, g_shape
+    ):
+        n_rows = x_indptr.shape[0] - 1
+        if n_rows == x_shape[0]:
+            sp_dim = x_shape[1]
+        else:
+            sp_dim = x_shape[0]
+
+        gout_data = np.zeros(x_data.shape, dtype=g_data.dtype)
+
+        if sp_dim > 4096:
+            # A dense row no longer fits in L1, so the random accesses into it
+            # would mostly miss. Instead, walk both rows in sorted order.
+            for i in range(n_rows):
+                g_start, g_end = g_indptr[i], g_indptr[i + 1]
+                x_start, x_end = x_indptr[i], x_indptr[i + 1]
+                if g_start == g_end or x_start == x_end:
+                    continue
+
+                g_order = np.argsort(g_indices[g_start:g_end]) + g_start
+                x_order = np.argsort(x_indices[x_start:x_end]) + x_start
+                n_g = g_end - g_start
+                k = 0
+                for j_ptr in x_order:
+                    col = x_indices[j_ptr]
+                    while k < n_g and g_indices[g_order[k]] < col:
+                        k += 1
+                    # Don't move `k`, `x` may also store this column twice
+                    m = k
+                    while m < n_g and g_indices[g_order[m]] == col:
+                        gout_data[j_ptr] += g_data[g_order[m]]
+                        m += 1
+
+            return gout_data
+
+        g_row = np.zeros(sp_dim, dtype=g_data.dtype)
+        for i in range(n_rows):
+            for j_ptr in range(g_indptr[i], g_indptr[i + 1]):
+                g_row[g_indices[j_ptr]] += g_data[j_ptr]
+
+            for j_ptr in range(x_indptr[i], x_indptr[i + 1]):
+                gout_data[j_ptr] = g_row[x_indices[j_ptr]]
+
+            for j_ptr in range(g_indptr[i], g_indptr[i + 1]):
+                g_row[g_indices[j_ptr]] = 0
+
+        return gout_data
+
+    return csm_grad
+
+
+# Scaling along the compressed axis: columns of a CSC, rows of a CSR
+@numba_funcify.register(ColScaleCSC)
+@numba_funcify.register(RowScaleCSR)
+def numba_funcify_ColScaleCSC(op, node, **kwargs):
+    @numba_basic.numba_njit
+    def col_scale_csc(x, s):
+        y = x.copy()
+        indptr = y.indptr
+        data = y.data
+        for j in range(indptr.shape[0] - 1):
+            s_j = s[j]
+            for k in range(indptr[j], indptr[j + 1]):
+                data[k] *= s_j
+        return y
+
+    return col_scale_csc
+
+
+# Scaling along the other axis: rows of a CSC, columns of a CSR
+@numba_funcify.register(RowScaleCSC)
+@numba_funcify.register(ColScaleCSR)
+def numba_funcify_RowScaleCSC(op, node, **kwargs):
+    @numba_basic.numba_njit
+    def row_scale_csc(x, s):
+        y = x.copy()
+        indices = y.indices
+        data = y.data
+        for k in range(data.shape[0]):
+            data[k] *= s[indices[k]]
+        return y
+
+    return row_scale_csc
+
+
+@numba_funcify.register(GetItem2Lists)
+def numba_funcify_GetItem2Lists(op, node, **kwargs):
+    out_dtype = node.outputs[0].type.numpy_dtype
+    is_csr = node.inputs[0].type.format == "csr"
+
+    @numba_basic.numba_njit
+    def get_item_2lists(x, ind1, ind2):
+        n_rows, n_cols = x.shape
+        indptr = x.indptr
+        indices = x.indices
+        data = x.data
+        n = ind1.shape[0]
+        if ind2.shape[0] != n:
+            raise ValueError("Index arrays must have the same length")
+
+        out = np.zeros(n, dtype=out_dtype)
+        for k in range(n):
+            i = ind1[k]
+            j = ind2[k]
+            if i < 0:
+                i += n_rows
+            if j < 0:
+                j += n_cols
+            if i < 0 or i >= n_rows or j < 0 or j >= n_cols:
+                raise IndexError("Index out of bounds")
+
+            if is_csr:
+                major, minor = i, j
+            else:
+                major, minor = j, i
+            # Indices may be unsorted or duplicated, so scan the whole segment
+            # and sum all matches, like scipy does
+            for p in range(indptr[major], indptr[major + 1]):
+                if indices[p] == minor:
+                    out[k] += data[p]
+        return out
+
+    return get_item_2lists
+
+
+@numba_funcify.register(MulSD)
+def numba_funcify_MulSD(op, node, **kwargs):
+    out_dtype = node.outputs[0].type.numpy_dtype
+    is_csr = node.inputs[0].type.format == "csr"
+
+    if node.inputs[1].type.ndim == 0:
+
+        @numba_basic.numba_njit
+        def mul_s_d(x, y):
+            z = x.astype(out_dtype)
+            z.data[:] *= y.item()
+            return z
+
+        return mul_s_d
+
+    @numba_basic.numba_njit
+    def mul_s_d(x, y):
+        z = x.astype(out_dtype)
+        indices = z.indices
+        indptr = z.indptr
+        data = z.data
+        for i in range(indptr.shape[0] - 1):
+            for k in range(indptr[i], indptr[i + 1]):
+                if is_csr:
+                    data[k] *= y[i, indices[k]]
+                else:
+                    data[k] *= y[indices[k], i]
+        return z
+
+    return mul_s_d
+
+
+@numba_funcify.register(StructuredDotGradCSC)
+@numba_funcify.register(StructuredDotGradCSR)
+def numba_funcify_StructuredDotGrad(op, node, **kwargs):
+    _, _, b, g_ab = node.inputs
+    if not (isinstance(b.type, TensorType) and isinstance(g_ab.type, TensorType)):
+        return generate_fallback_impl(op, node, **kwargs)
+
+    out_dtype = node.outputs[0].type.numpy_dtype
+    is_csc = isinstance(op, StructuredDotGradCSC)
+
+    @numba_basic.numba_njit
+    def structured_dot_grad(a_indices, a_indptr, b, g_ab):
+        n_k = b.shape[1]
+        out = np.zeros(a_indices.shape[0], dtype=out_dtype)
+        for major in range(a_indptr.shape[0] - 1):
+            for p in range(a_indptr[major], a_indptr[major + 1]):
+                # The grad of a[i, j] is the dot product of g_ab[i] and b[j]
+                if is_csc:
+                    i, j = a_indices[p], major
+                else:
+                    i, j = major, a_indices[p]
+                ip = 0.0
+                for k in range(n_k):
+                    ip += b[j, k] * g_ab[i, k]
+                out[p] = ip
+        return out
+
+    return structured_dot_grad
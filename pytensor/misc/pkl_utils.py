@@ -43,9 +43,15 @@ class StripPickler(Pickler):
             strip_pickler.dump(fn_args)
     """
 
-    def __init__(self, file, protocol: int = 0, extra_tag_to_remove: str | None = None):
+    def __init__(
+        self,
+        file,
+        protocol: int = 0,
+        extra_tag_to_remove: str | None = None,
+        buffer_callback=None,
+    ):
         # Can't use super as Pickler isn't a new style class
-        super().__init__(file, protocol)
+        super().__init__(file, protocol, buffer_callback=buffer_callback)
         self.tag_to_remove = ["trace", "test_value"]
         if extra_tag_to_remove:
             self.tag_to_remove.extend(extra_tag_to_remove)
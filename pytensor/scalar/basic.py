@@ -14,6 +14,7 @@ import builtins
 import math
 from collections.abc import Callable
 from copy import copy
+from functools import lru_cache
 from itertools import chain
 from textwrap import dedent
 from typing import Any, TypeAlias
@@ -24,7 +25,14 @@ import pytensor
 from pytensor import printing
 from pytensor.configdefaults import config
 from pytensor.gradient import DisconnectedType, grad_undefined
-from pytensor.graph.basic import Apply, Constant, Variable, applys_between, clone
+from pytensor.graph.basic import (
+    Apply,
+    Constant,
+    Variable,
+    applys_between,
+    clone,
+    io_toposort,
+)
 from pytensor.graph.fg import FunctionGraph
 from pytensor.graph.op import HasInnerGraph
 from pytensor.graph.rewriting.basic import MergeOptimizer
@@ -58,14 +66,17 @@ class IntegerDivisionError(Exception):
 
 
 def upcast(dtype, *dtypes) -> str:
+    return _upcast(config.cast_policy, config.floatX, dtype, *dtypes)
+
+
+# The result only depends on the dtypes and on the config, and `upcast` is
+# called whenever a scalar or elemwise node is built, so it is memoized
+@lru_cache(maxsize=1024)
+def _upcast(cast_policy, floatX, dtype, *dtypes) -> str:
     # This tries to keep data in floatX or lower precision, unless we
     # explicitly request a higher precision datatype.
-    keep_float32 = [
-        (config.cast_policy == "numpy+floatX" and config.floatX == "float32")
-    ]
-    keep_float16 = [
-        (config.cast_policy == "numpy+floatX" and config.floatX == "float16")
-    ]
+    keep_float32 = [(cast_policy == "numpy+floatX" and floatX == "float32")]
+    keep_float16 = [(cast_policy == "numpy+floatX" and floatX == "float16")]
 
     def make_array(dt):
         if dt == "float64":
@@ -428,13 +439,14 @@ class ScalarType(CType, HasDataType, HasShape):
             return None
         if self.dtype == "bool":
             return "1" if data else "0"
-        if data == np.inf:
-            return "INFINITY"
-        if data == -np.inf:
-            return "-INFINITY"
-        if np.isnan(data):
+        # Checked on a Python float, which is much cheaper than going through
+        # NumPy ufuncs for a single value
+        value = float(data)
+        if math.isfinite(value):
+            return str(data)
+        if math.isnan(value):
             return "NAN"
-        return str(data)
+        return "INFINITY" if value > 0 else "-INFINITY"
 
     def c_declare(self, name, sub, check_input=True):
         dtype = self.dtype_specs()[1]
@@ -1652,6 +1664,7 @@ isinf = IsInf()
 
 
 class InRange(LogicalComparison):
+    __props__ = ("openlow", "openhi")
     nin = 3
 
     def __init__(self, openlow, openhi):
@@ -1676,7 +1689,12 @@ class InRange(LogicalComparison):
         cmp1 = ">" if self.openlow else ">="
         cmp2 = "<" if self.openhi else "<="
 
-        return f"{z} = {x} {cmp1} {low} && {x} {cmp2} {hi};"
+        # Bitwise `&` instead of `&&` avoids a short-circuit branch, so the
+        # comparison can be vectorized inside Elemwise loops
+        return f"{z} = ({x} {cmp1} {low}) & ({x} {cmp2} {hi});"
+
+    def c_code_cache_version(self):
+        return (*super().c_code_cache_version(), 1)
 
     def get_grad(self, elem):
         if elem.type in complex_types:
@@ -3143,6 +3161,8 @@ class Log1p(UnaryScalarOp):
     """
 
     nfunc_spec = ("log1p", 1, 1)
+    amd_float32 = "amd_vrsa_log1pf"
+    amd_float64 = "amd_vrda_log1p"
 
     def impl(self, x):
         # If x is an int8 or uint8, numpy.log1p will compute the result in
@@ -3217,6 +3237,8 @@ exp = Exp(upgrade_to_float, name="exp")
 
 class Exp2(UnaryScalarOp):
     nfunc_spec = ("exp2", 1, 1)
+    amd_float32 = "amd_vrsa_exp2f"
+    amd_float64 = "amd_vrda_exp2"
 
     def impl(self, x):
         # If x is an int8 or uint8, numpy.exp2 will compute the result in
@@ -3253,6 +3275,8 @@ exp2 = Exp2(upgrade_to_float, name="exp2")
 
 class Expm1(UnaryScalarOp):
     nfunc_spec = ("expm1", 1, 1)
+    amd_float32 = "amd_vrsa_expm1f"
+    amd_float64 = "amd_vrda_expm1"
 
     def impl(self, x):
         # If x is an int8 or uint8, numpy.expm1 will compute the result in
@@ -4092,7 +4116,7 @@ class ScalarInnerGraphOp(ScalarOp, HasInnerGraph):
         self.prepare_node_called = set()
         super().__init__(*args, **kwargs)
 
-    def _cleanup_graph(self, inputs, outputs):
+    def _cleanup_graph(self, inputs, outputs, fold_constants=False):
         # TODO: We could convert to TensorVariable, optimize graph,
         # and then convert back to ScalarVariable.
         # This would introduce rewrites like `log(1 + x) -> log1p`.
@@ -4107,6 +4131,9 @@ class ScalarInnerGraphOp(ScalarOp, HasInnerGraph):
                     "composed of scalar operations."
                 )
 
+        if fold_constants:
+            self._fold_constants(fgraph)
+
         # Run MergeOptimization to avoid duplicated nodes
         MergeOptimizer().rewrite(fgraph)
 
@@ -4128,6 +4155,38 @@ class ScalarInnerGraphOp(ScalarOp, HasInnerGraph):
 
         return inputs, outputs
 
+    @staticmethod
+    def _fold_constants(fgraph):
+        """Replace the nodes whose inputs are all constants by their value.
+
+        The values are computed by the ops' `impl` on the constants' own
+        dtypes, and each one is cast to the dtype of the output it replaces,
+        as the generated C code would do. Outputs are left alone, as they must
+        stay the outputs of an `Apply` node.
+        """
+        for node in fgraph.toposort():
+            if (
+                node.inputs
+                and all(isinstance(inp, Constant) for inp in node.inputs)
+                and not any(out in fgraph.outputs for out in node.outputs)
+            ):
+                with np.errstate(all="ignore"):
+                    values = node.op.impl(
+                        *(
+                            np.asarray(inp.data, dtype=inp.type.dtype)
+                            for inp in node.inputs
+                        )
+                    )
+                if node.nout == 1:
+                    values = [values]
+                fgraph.replace_all(
+                    [
+                        (out, constant(value, dtype=out.type.dtype))
+                        for out, value in zip(node.outputs, values, strict=True)
+                    ],
+                    import_missing=True,
+                )
+
     @property
     def fn(self):
         return None
@@ -4268,6 +4327,12 @@ class ScalarInnerGraphOp(ScalarOp, HasInnerGraph):
         self.prepare_node_called = set()
 
 
+# C code templates shared between structurally identical `Composite`s,
+# keyed by `Composite._c_code_key`
+_composite_c_code_cache: dict = {}
+_composite_c_code_cache_size = 1024
+
+
 class Composite(ScalarInnerGraphOp):
     """
     Composite is an Op that takes a graph of scalar operations and
@@ -4287,46 +4352,44 @@ class Composite(ScalarInnerGraphOp):
         # contain a reference to an fgraph. As we want the Composite
         # to be pickable, we can't have reference to fgraph.
 
-        # Also, if there is Composite in the inner graph, we want to
-        # remove them. In that case, we do a more complicated clone
-        # that will flatten Composite. We don't need to do this
-        # recursively, as the way the fusion optimizer work, we have
-        # only 1 new Composite each time at the output.
+        # Also, if there are Composites in the inner graph, we want to
+        # inline them. We don't need to do this recursively, as inner
+        # Composites were already flattened when they were created.
         for i in inputs:
             assert i not in outputs  # This isn't supported, use identity
 
-        if len(outputs) > 1 or not any(
-            isinstance(var.owner.op, Composite) for var in outputs
-        ):
-            # No inner Composite
-            inputs, outputs = clone(inputs, outputs)
-        else:
-            # Inner Composite that we need to flatten
-            assert len(outputs) == 1
-            # 1. Create a new graph from inputs up to the
-            # Composite
-            res = pytensor.compile.rebuild_collect_shared(
-                inputs=inputs, outputs=outputs[0].owner.inputs, copy_inputs_over=False
-            )  # Clone also the inputs
-            # 2. We continue this partial clone with the graph in
-            # the inner Composite
-            res2 = pytensor.compile.rebuild_collect_shared(
-                inputs=outputs[0].owner.op.inputs,
-                outputs=outputs[0].owner.op.outputs,
-                replace=dict(zip(outputs[0].owner.op.inputs, res[1], strict=True)),
-            )
-            assert len(res2[1]) == len(outputs)
-            assert len(res[0]) == len(inputs)
-            assert res[0] != inputs
-            inputs, outputs = res[0], res2[1]
+        inputs, outputs = clone(inputs, outputs)
+        outputs = self._inline_composites(inputs, outputs)
 
-        self.inputs, self.outputs = self._cleanup_graph(inputs, outputs)
+        self.inputs, self.outputs = self._cleanup_graph(
+            inputs, outputs, fold_constants=True
+        )
         self.inputs_type = tuple(input.type for input in self.inputs)
         self.outputs_type = tuple(output.type for output in self.outputs)
         self.nin = len(inputs)
         self.nout = len(outputs)
         super().__init__()
 
+    @staticmethod
+    def _inline_composites(inputs, outputs):
+        """Replace the `Composite` nodes between `inputs` and `outputs` by their inner graphs."""
+        from pytensor.graph.replace import clone_replace
+
+        memo = {}
+        for node in io_toposort(inputs, outputs):
+            new_inputs = [memo.get(inp, inp) for inp in node.inputs]
+            if isinstance(node.op, Composite):
+                new_outputs = clone_replace(
+                    node.op.outputs,
+                    replace=dict(zip(node.op.inputs, new_inputs, strict=True)),
+                )
+            elif any(new is not old for new, old in zip(new_inputs, node.inputs)):
+                new_outputs = node.clone_with_new_inputs(new_inputs).outputs
+            else:
+                continue
+            memo.update(zip(node.outputs, new_outputs, strict=True))
+        return [memo.get(out, out) for out in outputs]
+
     def __str__(self):
         if self._name is not None:
             return self._name
@@ -4423,6 +4486,39 @@ class Composite(ScalarInnerGraphOp):
     def grad(self, inputs, output_grads):
         raise NotImplementedError("grad is not implemented for Composite")
 
+    def _c_code_key(self):
+        """Return a hashable description of the structure of the inner graph.
+
+        Structurally identical graphs produce the same C code, so this is used
+        to share `c_code_template` between `Composite`s. The nodes are described
+        in the order of ``self.fgraph.toposort()``, which also assigns the
+        `nodenames` of the template. ``None`` is returned if the graph has
+        orphans that can't be rendered as C literals.
+        """
+        from pytensor.link.c.interface import CLinkerType
+
+        fg = self.fgraph
+        refs = {inp: i for i, inp in enumerate(fg.inputs)}
+        nodes = []
+        for node in fg.toposort():
+            node_inputs = []
+            for inp in node.inputs:
+                if inp not in refs:
+                    if not (
+                        isinstance(inp, Constant) and isinstance(inp.type, CLinkerType)
+                    ):
+                        return None
+                    refs[inp] = (inp.type, inp.type.c_literal(inp.data))
+                node_inputs.append(refs[inp])
+            refs.update((out, (len(nodes), k)) for k, out in enumerate(node.outputs))
+            nodes.append((node.op, tuple(node_inputs)))
+        return (
+            self.inputs_type,
+            self.outputs_type,
+            tuple(nodes),
+            tuple(refs[out] for out in fg.outputs),
+        )
+
     @property
     def c_code_template(self):
         from pytensor.link.c.interface import CLinkerType
@@ -4430,6 +4526,15 @@ class Composite(ScalarInnerGraphOp):
         if hasattr(self, "_c_code"):
             return self._c_code
 
+        key = self._c_code_key()
+        cached = _composite_c_code_cache.get(key) if key is not None else None
+        if cached is not None:
+            self._c_code, n_nodes, inner_float16 = cached
+            self.nodenames = [f"%(nodename)s_subnode{j}" for j in range(n_nodes)]
+            if inner_float16:
+                self.inner_float16 = True
+            return self._c_code
+
         fg = self.fgraph
         subd = {e: f"%(i{i})s" for i, e in enumerate(fg.inputs)}
 
@@ -4454,7 +4559,22 @@ class Composite(ScalarInnerGraphOp):
 
         _c_code = "{\n"
         i = 0
+        computed = {}
         for j, node in enumerate(fg.toposort()):
+            nodename = f"%(nodename)s_subnode{j}"
+            nodenames.append(nodename)
+
+            # Identical outputs are computed by clones of the same node (see
+            # `_cleanup_graph`), reuse the first result instead of recomputing it
+            node_key = (node.op, tuple(node.inputs))
+            if node_key in computed:
+                for output, prev_output in zip(
+                    node.outputs, computed[node_key].outputs, strict=True
+                ):
+                    subd[output] = subd[prev_output]
+                continue
+            computed[node_key] = node
+
             for output in node.outputs:
                 if output not in subd:
                     i += 1
@@ -4462,9 +4582,6 @@ class Composite(ScalarInnerGraphOp):
                     subd[output] = name
                     _c_code += f"{output.type.dtype_specs()[1]} {name};\n"
 
-            nodename = f"%(nodename)s_subnode{j}"
-            nodenames.append(nodename)
-
             s = node.op.c_code(
                 node,
                 nodename,
@@ -4483,6 +4600,15 @@ class Composite(ScalarInnerGraphOp):
 
         self._c_code = _c_code
 
+        if key is not None:
+            if len(_composite_c_code_cache) >= _composite_c_code_cache_size:
+                del _composite_c_code_cache[next(iter(_composite_c_code_cache))]
+            _composite_c_code_cache[key] = (
+                _c_code,
+                len(nodenames),
+                getattr(self, "inner_float16", False),
+            )
+
         return self._c_code
 
     def c_code(self, node, nodename, inames, onames, sub):
@@ -4502,7 +4628,7 @@ class Composite(ScalarInnerGraphOp):
         return self.c_code_template % d
 
     def c_code_cache_version_outer(self) -> tuple[int, ...]:
-        return (6,)
+        return (7,)
 
 
 class Compositef32:
@@ -13,7 +13,6 @@ from warnings import warn
 
 import numpy as np
 import scipy.sparse
-from numpy.lib.stride_tricks import as_strided
 
 import pytensor
 from pytensor import _as_symbolic, as_symbolic
@@ -22,7 +21,7 @@ from pytensor.configdefaults import config
 from pytensor.gradient import DisconnectedType, grad_not_implemented, grad_undefined
 from pytensor.graph.basic import Apply, Constant, Variable
 from pytensor.graph.op import Op
-from pytensor.link.c.op import COp
+from pytensor.link.c.op import OpenMPOp
 from pytensor.link.c.type import generic
 from pytensor.sparse.type import SparseTensorType, _is_sparse
 from pytensor.sparse.utils import hash_from_sparse
@@ -124,6 +123,17 @@ def _is_dense_variable(x):
     return isinstance(x.type, TensorType)
 
 
+def _expand_indptr(indptr):
+    """Return the compressed-axis index of every stored element.
+
+    This is the row of each element of a CSR matrix, or the column of each
+    element of a CSC one. It uses the dtype of `indptr`, usually int32, which
+    is faster to build and to index with than the default int64.
+
+    """
+    return np.repeat(np.arange(len(indptr) - 1, dtype=indptr.dtype), np.diff(indptr))
+
+
 def _is_dense(x):
     """
 
@@ -223,6 +233,16 @@ def sp_ones_like(x):
         The same as `x` with data changed for ones.
 
     """
+    if isinstance(x, SparseConstant) and x.format in ("csr", "csc"):
+        # The result is known, don't build a graph for it
+        x = x.data
+        ones = type(x)(
+            (np.ones_like(x.data), x.indices.copy(), x.indptr.copy()),
+            shape=x.shape,
+            copy=False,
+        )
+        return SparseConstant(SparseTensorType(format=x.format, dtype=x.dtype), ones)
+
     # TODO: don't restrict to CSM formats
     data, indices, indptr, _shape = csm_properties(x)
     return CSM(format=x.format)(ptb.ones_like(data), indices, indptr, _shape)
@@ -244,6 +264,11 @@ def sp_zeros_like(x):
 
     """
 
+    if isinstance(x, SparseConstant) and x.format in ("csr", "csc"):
+        x = x.data
+        zeros = type(x)(x.shape, dtype=x.dtype)
+        return SparseConstant(SparseTensorType(format=x.format, dtype=x.dtype), zeros)
+
     # TODO: don't restrict to CSM formats
     _, _, indptr, _shape = csm_properties(x)
     return CSM(format=x.format)(
@@ -258,8 +283,12 @@ def override_dense(*methods):
     def decorate(cls):
         def native(method):
             original = getattr(cls.__base__, method)
+            message = f"Method {method} is not implemented for sparse variables. The variable will be converted to dense."
 
             def to_dense(self, *args, **kwargs):
+                # Point the warning at the caller, so that the default warning
+                # filter only reports it once per call site
+                warn(message, stacklevel=2)
                 self = self.toarray()
                 new_args = [
                     arg.toarray()
@@ -267,9 +296,6 @@ def override_dense(*methods):
                     else arg
                     for arg in args
                 ]
-                warn(
-                    f"Method {method} is not implemented for sparse variables. The variable will be converted to dense."
-                )
                 return original(self, *new_args, **kwargs)
 
             return to_dense
@@ -281,6 +307,10 @@ def override_dense(*methods):
     return decorate
 
 
+def _is_scalar_index(x):
+    return np.isscalar(x) or getattr(x, "type", None) == iscalar
+
+
 @override_dense(
     "__abs__",
     "__ceil__",
@@ -401,10 +431,9 @@ class _sparse_py_operators(_tensor_py_operators):
 
     @property
     def shape(self):
-        # TODO: The plan is that the ShapeFeature in ptb.opt will do shape
-        # propagation and remove the dense_from_sparse from the graph.  This
-        # will *NOT* actually expand your sparse matrix just to get the shape.
-        return shape(dense_from_sparse(self))
+        # `Shape` works on sparse variables directly, and the ShapeFeature
+        # can still infer it from the `infer_shape` of the producing `Op`
+        return shape(self)
 
     ndim = property(lambda self: self.type.ndim)
     dtype = property(lambda self: self.type.dtype)
@@ -413,7 +442,7 @@ class _sparse_py_operators(_tensor_py_operators):
     # from dense matrices: it is the number of elements stored in the matrix
     # rather than the total number of elements that may be stored. Note also
     # that stored zeros *do* count in the size.
-    size = property(lambda self: csm_data(self).size)
+    size = property(lambda self: csm_data(self).shape[0])
 
     def zeros_like(model):
         return sp_zeros_like(model)
@@ -422,24 +451,13 @@ class _sparse_py_operators(_tensor_py_operators):
         if not isinstance(args, tuple):
             args = (args,)
 
-        if len(args) == 2:
-            scalar_arg_1 = (
-                np.isscalar(args[0]) or getattr(args[0], "type", None) == iscalar
-            )
-            scalar_arg_2 = (
-                np.isscalar(args[1]) or getattr(args[1], "type", None) == iscalar
-            )
-            if scalar_arg_1 and scalar_arg_2:
-                ret = get_item_scalar(self, args)
-            elif isinstance(args[0], list):
-                ret = get_item_2lists(self, args[0], args[1])
-            else:
-                ret = get_item_2d(self, args)
-        elif isinstance(args[0], list):
-            ret = get_item_list(self, args[0])
-        else:
-            ret = get_item_2d(self, args)
-        return ret
+        if isinstance(args[0], list):
+            if len(args) == 2:
+                return get_item_2lists(self, args[0], args[1])
+            return get_item_list(self, args[0])
+        if len(args) == 2 and _is_scalar_index(args[0]) and _is_scalar_index(args[1]):
+            return get_item_scalar(self, args)
+        return get_item_2d(self, args)
 
     def conj(self):
         return conjugate(self)
@@ -458,20 +476,32 @@ class SparseVariable(_sparse_py_operators, TensorVariable):
 class SparseConstantSignature(tuple):
     def __eq__(self, other):
         (a, b), (x, y) = self, other
-        return (
+        if not (
             a == x
             and (b.dtype == y.dtype)
             and (type(b) is type(y))
             and (b.shape == y.shape)
-            and (abs(b - y).sum() < 1e-6 * b.nnz)
-        )
+        ):
+            return False
+        if (
+            b.format in ("csc", "csr")
+            and b.nnz == y.nnz
+            and np.array_equal(b.indptr, y.indptr)
+            and np.array_equal(b.indices, y.indices)
+        ):
+            # Same sparsity pattern: compare the stored values directly
+            # instead of allocating the sparse difference
+            return bool(np.abs(b.data - y.data).sum() < 1e-6 * b.nnz)
+        return bool(abs(b - y).sum() < 1e-6 * b.nnz)
 
     def __ne__(self, other):
         return not self == other
 
     def __hash__(self):
         (a, b) = self
-        return hash(type(self)) ^ hash(a) ^ hash(type(b))
+        # Only include what `__eq__` compares exactly: the values are compared
+        # with a tolerance, and explicitly stored zeros don't affect equality
+        return hash((type(self), a, type(b), b.dtype, b.shape))
 
     def pytensor_hash(self):
         (_, d) = self
@@ -491,6 +521,11 @@ class SparseConstant(SparseVariable, TensorConstant):
     def __repr__(self):
         return str(self)
 
+    @property
+    def size(self):
+        # The number of stored elements is known, no need to extract the data
+        return ptb.constant(self.data.nnz, dtype="int64")
+
     @property
     def unique_value(self):
         return None
@@ -528,15 +563,30 @@ csr_fmatrix = SparseTensorType(format="csr", dtype="float32")
 bsr_fmatrix = SparseTensorType(format="bsr", dtype="float32")
 
 all_dtypes = list(SparseTensorType.dtype_specs_map)
-complex_dtypes = [t for t in all_dtypes if t[:7] == "complex"]
-float_dtypes = [t for t in all_dtypes if t[:5] == "float"]
-int_dtypes = [t for t in all_dtypes if t[:3] == "int"]
-uint_dtypes = [t for t in all_dtypes if t[:4] == "uint"]
+complex_dtypes = []
+float_dtypes = []
+int_dtypes = []
+uint_dtypes = []
+_dtype_groups = {
+    "c": complex_dtypes,
+    "f": float_dtypes,
+    "i": int_dtypes,
+    "u": uint_dtypes,
+}
+for _dtype in all_dtypes:
+    _dtype_groups[_dtype[0]].append(_dtype)
+del _dtype, _dtype_groups
 integer_dtypes = int_dtypes + uint_dtypes
 
 continuous_dtypes = complex_dtypes + float_dtypes
 discrete_dtypes = int_dtypes + uint_dtypes
 
+# Sets of the groups above, for the membership tests of make_node and grad
+_complex_dtypes = frozenset(complex_dtypes)
+_continuous_dtypes = frozenset(continuous_dtypes)
+_discrete_dtypes = frozenset(discrete_dtypes)
+_integer_dtypes = frozenset(integer_dtypes)
+
 
 class CSMProperties(Op):
     """Create arrays containing all the properties of a given sparse matrix.
@@ -597,12 +647,12 @@ class CSMProperties(Op):
     def perform(self, node, inputs, out):
         (csm,) = inputs
         out[0][0] = csm.data
-        if str(csm.data.dtype) == "int32":
-            out[0][0] = np.asarray(out[0][0], dtype="int32")
-        # backport
-        out[1][0] = np.asarray(csm.indices, dtype="int32")
-        out[2][0] = np.asarray(csm.indptr, dtype="int32")
-        out[3][0] = np.asarray(csm.shape, dtype="int32")
+        # scipy usually stores int32 indices already, in which case they are
+        # returned as views (see `view_map`)
+        indices, indptr = csm.indices, csm.indptr
+        out[1][0] = indices if indices.dtype == np.int32 else indices.astype(np.int32)
+        out[2][0] = indptr if indptr.dtype == np.int32 else indptr.astype(np.int32)
+        out[3][0] = np.array(csm.shape, dtype=np.int32)
 
     def grad(self, inputs, g):
         # g[1:] is all integers, so their Jacobian in this op
@@ -657,6 +707,17 @@ def csm_shape(csm):
     return csm_properties(csm)[3]
 
 
+def _as_int32(x, name):
+    """Convert `x` to an int32 array, checking that no value is changed."""
+    x = np.asarray(x)
+    if x.dtype == np.int32:
+        return x
+    x_32 = x.astype(np.int32)
+    if not np.array_equal(x, x_32):
+        raise TypeError(f"{name} must be representable as int32")
+    return x_32
+
+
 class CSM(Op):
     """Construct a CSM matrix from constituent parts.
 
@@ -699,33 +760,26 @@ class CSM(Op):
         """
         data = ptb.as_tensor_variable(data)
 
-        if not isinstance(indices, Variable):
-            indices_ = np.asarray(indices)
-            indices_32 = np.asarray(indices, dtype="int32")
-            assert (indices_ == indices_32).all()
-            indices = indices_32
-        if not isinstance(indptr, Variable):
-            indptr_ = np.asarray(indptr)
-            indptr_32 = np.asarray(indptr, dtype="int32")
-            assert (indptr_ == indptr_32).all()
-            indptr = indptr_32
-        if not isinstance(shape, Variable):
-            shape_ = np.asarray(shape)
-            shape_32 = np.asarray(shape, dtype="int32")
-            assert (shape_ == shape_32).all()
-            shape = shape_32
-
-        indices = ptb.as_tensor_variable(indices)
-        indptr = ptb.as_tensor_variable(indptr)
-        shape = ptb.as_tensor_variable(shape)
+        if isinstance(indices, Variable):
+            indices = ptb.as_tensor_variable(indices)
+        else:
+            indices = ptb.constant(_as_int32(indices, "indices"))
+        if isinstance(indptr, Variable):
+            indptr = ptb.as_tensor_variable(indptr)
+        else:
+            indptr = ptb.constant(_as_int32(indptr, "indptr"))
+        if isinstance(shape, Variable):
+            shape = ptb.as_tensor_variable(shape)
+        else:
+            shape = ptb.constant(_as_int32(shape, "shape"))
 
         if data.type.ndim != 1:
             raise TypeError("data argument must be a vector", data.type, data.type.ndim)
-        if indices.type.ndim != 1 or indices.type.dtype not in discrete_dtypes:
+        if indices.type.ndim != 1 or indices.type.dtype not in _discrete_dtypes:
             raise TypeError("indices must be vector of integers", indices, indices.type)
-        if indptr.type.ndim != 1 or indptr.type.dtype not in discrete_dtypes:
+        if indptr.type.ndim != 1 or indptr.type.dtype not in _discrete_dtypes:
             raise TypeError("indices must be vector of integers", indptr, indptr.type)
-        if shape.type.ndim != 1 or shape.type.dtype not in discrete_dtypes:
+        if shape.type.ndim != 1 or shape.type.dtype not in _discrete_dtypes:
             raise TypeError("n_rows must be integer type", shape, shape.type)
 
         return Apply(
@@ -751,15 +805,14 @@ class CSM(Op):
                 + ")"
             )
             raise ValueError(errmsg)
-        if self.format == "csc":
-            out[0] = scipy.sparse.csc_matrix(
-                (data, indices.copy(), indptr.copy()), np.asarray(_shape), copy=False
-            )
-        else:
-            assert self.format == "csr"
-            out[0] = scipy.sparse.csr_matrix(
-                (data, indices.copy(), indptr.copy()), _shape.copy(), copy=False
-            )
+        # `view_map` can only declare the view of `data`, so `indices` and
+        # `indptr` must still be copied: an inplace op on the output (e.g.
+        # sorting the indices) would otherwise modify our inputs.
+        shape = (int(_shape[0]), int(_shape[1]))
+        cls = (
+            scipy.sparse.csc_matrix if self.format == "csc" else scipy.sparse.csr_matrix
+        )
+        out[0] = cls((data, indices.copy(), indptr.copy()), shape=shape, copy=False)
 
     def connection_pattern(self, node):
         return [[True], [False], [False], [False]]
@@ -854,19 +907,35 @@ class CSMGrad(Op):
         else:
             sp_dim = x_shape[0]
 
-        g_row = np.zeros(sp_dim, dtype=g_data.dtype)
-        gout_data = np.zeros(x_data.shape, dtype=node.outputs[0].dtype)
-
-        for i in range(len(x_indptr) - 1):
-            for j_ptr in range(g_indptr[i], g_indptr[i + 1]):
-                g_row[g_indices[j_ptr]] += g_data[j_ptr]
-
-            for j_ptr in range(x_indptr[i], x_indptr[i + 1]):
-                gout_data[j_ptr] = g_row[x_indices[j_ptr]]
+        n_rows = len(x_indptr) - 1
+        rows = np.arange(n_rows)
+        # Index of the compressed dimension each stored entry belongs to
+        x_rows = np.repeat(rows, np.diff(x_indptr))
+        g_rows = np.repeat(rows, np.diff(g_indptr[: n_rows + 1]))
 
-            for j_ptr in range(g_indptr[i], g_indptr[i + 1]):
-                g_row[g_indices[j_ptr]] = 0
+        g_cols = g_indices[: len(g_rows)]
+        g_vals = g_data[: len(g_rows)]
+        x_cols = x_indices[: len(x_rows)]
 
+        gout_data = np.zeros(x_data.shape, dtype=node.outputs[0].dtype)
+        if len(g_rows) * 8 >= n_rows * sp_dim:
+            # Scatter the gradient into a dense scratch and gather from it
+            g_dense = np.zeros((n_rows, sp_dim), dtype=g_data.dtype)
+            np.add.at(g_dense, (g_rows, g_cols), g_vals)
+            gout_data[: len(x_rows)] = g_dense[x_rows, x_cols]
+        elif len(g_rows):
+            # The gradient is much sparser than the dense scratch would be:
+            # match the (row, col) positions of both matrices with a search
+            # over the sorted gradient positions instead
+            g_keys = g_rows * np.int64(sp_dim) + g_cols
+            order = np.argsort(g_keys, kind="stable")
+            g_keys, starts = np.unique(g_keys[order], return_index=True)
+            g_sums = np.add.reduceat(g_vals[order], starts)
+
+            x_keys = x_rows * np.int64(sp_dim) + x_cols
+            pos = np.minimum(np.searchsorted(g_keys, x_keys), len(g_keys) - 1)
+            found = g_keys[pos] == x_keys
+            gout_data[: len(x_rows)][found] = g_sums[pos[found]]
         g_out[0] = gout_data
 
     def infer_shape(self, fgraph, node, shapes):
@@ -878,6 +947,8 @@ csm_grad = CSMGrad
 
 class Cast(Op):
     __props__ = ("out_type",)
+    # The output shares the indices and indptr of the input
+    view_map = {0: [0]}
 
     def __init__(self, out_type):
         self.out_type = out_type
@@ -893,23 +964,28 @@ class Cast(Op):
         (x,) = inputs
         (out,) = outputs
         assert _is_sparse(x)
-        out[0] = x.astype(self.out_type)
+        # Only the data needs to be converted
+        out[0] = type(x)(
+            (x.data.astype(self.out_type, copy=False), x.indices, x.indptr),
+            shape=x.shape,
+            copy=False,
+        )
 
     def grad(self, inputs, outputs_gradients):
         gz = outputs_gradients[0]
 
-        if gz.dtype in complex_dtypes:
+        if gz.dtype in _complex_dtypes:
             raise NotImplementedError("grad not implemented for complex types")
-        if inputs[0].dtype in complex_dtypes:
+        if inputs[0].dtype in _complex_dtypes:
             raise NotImplementedError("grad not implemented for complex types")
 
-        if gz.dtype in discrete_dtypes:
-            if inputs[0].dtype in discrete_dtypes:
+        if gz.dtype in _discrete_dtypes:
+            if inputs[0].dtype in _discrete_dtypes:
                 return [inputs[0].zeros_like(dtype=config.floatX)]
             else:
                 return [inputs[0].zeros_like()]
         else:
-            if inputs[0].dtype in discrete_dtypes:
+            if inputs[0].dtype in _discrete_dtypes:
                 return [gz]
             else:
                 return [Cast(inputs[0].dtype)(gz)]
@@ -1049,6 +1125,14 @@ class SparseFromDense(Op):
         if isinstance(x.type, SparseTensorType):
             return x
 
+        # Converting back a sparse matrix that was just densified
+        if (
+            x.owner is not None
+            and isinstance(x.owner.op, DenseFromSparse)
+            and x.owner.inputs[0].type.format == self.format
+        ):
+            return x.owner.inputs[0]
+
         return super().__call__(x)
 
     def make_node(self, x):
@@ -1124,7 +1208,7 @@ class GetItemList(Op):
 
         ind = ptb.as_tensor_variable(index)
         assert ind.ndim == 1
-        assert ind.dtype in integer_dtypes
+        assert ind.dtype in _integer_dtypes
 
         return Apply(self, [x, ind], [x.type()])
 
@@ -1162,12 +1246,7 @@ class GetItemListGrad(Op):
 
         ind = ptb.as_tensor_variable(index)
         assert ind.ndim == 1
-        assert ind.dtype in integer_dtypes
-
-        scipy_ver = [int(n) for n in scipy.__version__.split(".")[:2]]
-
-        if not scipy_ver >= [0, 13]:
-            raise NotImplementedError("Scipy version is to old")
+        assert ind.dtype in _integer_dtypes
 
         return Apply(self, [x, ind, gz], [x.type()])
 
@@ -1177,14 +1256,17 @@ class GetItemListGrad(Op):
         indices = inp[1]
         gz = inp[2]
 
-        if x.format in ["csr"]:
-            y = scipy.sparse.csr_matrix((x.shape[0], x.shape[1]))
-        else:
-            y = scipy.sparse.csc_matrix((x.shape[0], x.shape[1]))
-        for a in range(0, len(indices)):
-            y[indices[a]] = gz[a]
+        # Row `a` of `gz` is the gradient of row `indices[a]` of `x`; the
+        # contributions of repeated indices are summed by the COO conversion
+        gz = gz.tocsr()
+        indices = np.where(indices < 0, indices + x.shape[0], indices)
+        rows = np.repeat(indices, np.diff(gz.indptr))
+        y = scipy.sparse.coo_matrix(
+            (gz.data.astype(node.outputs[0].dtype, copy=False), (rows, gz.indices)),
+            shape=x.shape,
+        )
 
-        out[0] = y
+        out[0] = y.asformat(x.format)
 
 
 get_item_list_grad = GetItemListGrad()
@@ -1211,8 +1293,8 @@ class GetItem2Lists(Op):
         assert x.format in ("csr", "csc")
         ind1 = ptb.as_tensor_variable(ind1)
         ind2 = ptb.as_tensor_variable(ind2)
-        assert ind1.dtype in integer_dtypes
-        assert ind2.dtype in integer_dtypes
+        assert ind1.dtype in _integer_dtypes
+        assert ind2.dtype in _integer_dtypes
 
         return Apply(self, [x, ind1, ind2], [vector()])
 
@@ -1253,8 +1335,8 @@ class GetItem2ListsGrad(Op):
         ind2 = ptb.as_tensor_variable(ind2)
         assert ind1.ndim == 1
         assert ind2.ndim == 1
-        assert ind1.dtype in integer_dtypes
-        assert ind2.dtype in integer_dtypes
+        assert ind1.dtype in _integer_dtypes
+        assert ind2.dtype in _integer_dtypes
 
         return Apply(self, [x, ind1, ind2, gz], [x.type()])
 
@@ -1265,20 +1347,40 @@ class GetItem2ListsGrad(Op):
         ind2 = inp[2]
         gz = inp[3]
 
-        if x.format in ["csr"]:
-            y = scipy.sparse.csr_matrix((x.shape[0], x.shape[1]))
-        else:
-            y = scipy.sparse.csc_matrix((x.shape[0], x.shape[1]))
-        z = 0
-        for z in range(0, len(ind1)):
-            y[(ind1[z], ind2[z])] = gz[z]
+        # The contributions of repeated (row, col) pairs are summed by the
+        # COO conversion
+        ind1 = np.where(ind1 < 0, ind1 + x.shape[0], ind1)
+        ind2 = np.where(ind2 < 0, ind2 + x.shape[1], ind2)
+        y = scipy.sparse.coo_matrix(
+            (np.asarray(gz, dtype=node.outputs[0].dtype), (ind1, ind2)),
+            shape=x.shape,
+        )
 
-        out[0] = y
+        out[0] = y.asformat(x.format)
 
 
 get_item_2lists_grad = GetItem2ListsGrad()
 
 
+def _normalize_slice_arg(val, name, generic_None):
+    """Convert a slice `start`, `stop` or `step` into an input of `GetItem2d`.
+
+    ``None`` becomes `generic_None`, anything else must be an integer scalar.
+
+    """
+    if val is None:
+        return generic_None
+    if not isinstance(val, Variable):
+        val = ptb.as_tensor_variable(val)
+    if not (val.ndim == 0 and val.dtype in tensor_discrete_dtypes):
+        raise ValueError(
+            f"Impossible to index into a sparse matrix with slice where {name}={val}",
+            val.ndim,
+            val.dtype,
+        )
+    return val
+
+
 class GetItem2d(Op):
     """Implement a subtensor of sparse variable, returning a sparse matrix.
 
@@ -1314,7 +1416,6 @@ class GetItem2d(Op):
             Tuple of slice object.
 
         """
-        scipy_ver = [int(n) for n in scipy.__version__.split(".")[:2]]
         x = as_sparse_variable(x)
         assert x.format in ("csr", "csc")
         assert len(index) in (1, 2)
@@ -1325,61 +1426,10 @@ class GetItem2d(Op):
         for ind in index:
             if isinstance(ind, slice):
                 # in case of slice is written in pytensor variable
-                start = ind.start
-                stop = ind.stop
-                step = ind.step
-                # If start or stop or step are None, make them a Generic
-                # constant. Else, they should be converted to Tensor Variables
-                # of dimension 1 and int/uint dtype.
-                if scipy_ver < [0, 14] and ind.step is not None:
-                    raise ValueError(
-                        "Slice with step is not support with current"
-                        " version of Scipy."
-                    )
-                if ind.step is None or ind.step == 1:
-                    step = generic_None
-                else:
-                    if not isinstance(step, Variable):
-                        step = ptb.as_tensor_variable(step)
-                    if not (step.ndim == 0 and step.dtype in tensor_discrete_dtypes):
-                        raise ValueError(
-                            (
-                                "Impossible to index into a sparse matrix with "
-                                f"slice where step={step}"
-                            ),
-                            step.ndim,
-                            step.dtype,
-                        )
-
-                if start is None:
-                    start = generic_None
-                else:
-                    if not isinstance(start, Variable):
-                        start = ptb.as_tensor_variable(start)
-                    if not (start.ndim == 0 and start.dtype in tensor_discrete_dtypes):
-                        raise ValueError(
-                            (
-                                "Impossible to index into a sparse matrix with "
-                                f"slice where start={start}"
-                            ),
-                            start.ndim,
-                            start.dtype,
-                        )
-
-                if stop is None:
-                    stop = generic_None
-                else:
-                    if not isinstance(stop, Variable):
-                        stop = ptb.as_tensor_variable(stop)
-                    if not (stop.ndim == 0 and stop.dtype in tensor_discrete_dtypes):
-                        raise ValueError(
-                            (
-                                "Impossible to index into a sparse matrix with "
-                                f"slice where stop={stop}"
-                            ),
-                            stop.ndim,
-                            stop.dtype,
-                        )
+                step = None if ind.step is None or ind.step == 1 else ind.step
+                start = _normalize_slice_arg(ind.start, "start", generic_None)
+                stop = _normalize_slice_arg(ind.stop, "stop", generic_None)
+                step = _normalize_slice_arg(step, "step", generic_None)
 
             elif (
                 isinstance(ind, Variable) and getattr(ind, "ndim", -1) == 0
@@ -1540,6 +1590,8 @@ class Neg(Op):
     """
 
     __props__ = ()
+    # The output shares the indices and indptr of the input
+    view_map = {0: [0]}
 
     def __str__(self):
         return "Sparse" + self.__class__.__name__
@@ -1561,7 +1613,7 @@ class Neg(Op):
         (x,) = inputs
         (out,) = outputs
         assert _is_sparse(x)
-        out[0] = -x
+        out[0] = type(x)((-x.data, x.indices, x.indptr), x.shape, copy=False)
 
     def grad(self, inputs, gout):
         (x,) = inputs
@@ -1590,6 +1642,7 @@ class ColScaleCSC(Op):
 
     # :note: The grad implemented is structured.
 
+    view_map = {0: [0]}
     __props__ = ()
 
     def make_node(self, x, s):
@@ -1604,12 +1657,11 @@ class ColScaleCSC(Op):
         assert x.format == "csc"
         assert s.shape == (N,)
 
-        y = x.copy()
+        # Column of each stored element
+        cols = _expand_indptr(x.indptr)
+        y_data = np.multiply(x.data, s[cols], dtype=x.dtype)
 
-        for j in range(0, N):
-            y.data[y.indptr[j] : y.indptr[j + 1]] *= s[j]
-
-        z[0] = y
+        z[0] = scipy.sparse.csc_matrix((y_data, x.indices, x.indptr), (M, N))
 
     def grad(self, inputs, gout):
         (x, s) = inputs
@@ -1652,11 +1704,8 @@ class RowScaleCSC(Op):
         indices = x.indices
         indptr = x.indptr
 
-        y_data = x.data.copy()
-
-        for j in range(0, N):
-            for i_idx in range(indptr[j], indptr[j + 1]):
-                y_data[i_idx] *= s[indices[i_idx]]
+        # `indices` holds the row of each stored element
+        y_data = np.multiply(x.data, s[indices], dtype=x.dtype)
 
         z[0] = scipy.sparse.csc_matrix((y_data, indices, indptr), (M, N))
 
@@ -1669,6 +1718,96 @@ class RowScaleCSC(Op):
         return [ins_shapes[0]]
 
 
+class ColScaleCSR(Op):
+    # Scale each columns of a sparse matrix by the corresponding
+    # element of a dense vector
+
+    # :param x: A sparse matrix.
+    # :param s: A dense vector with length equal to the number
+    #           of columns of `x`.
+
+    # :return: A sparse matrix in the same format as `x` which
+    #          each column had been multiply by the corresponding
+    #          element of `s`.
+
+    # :note: The grad implemented is structured.
+
+    view_map = {0: [0]}
+    __props__ = ()
+
+    def make_node(self, x, s):
+        if x.format != "csr":
+            raise ValueError("x was not a csr matrix")
+        return Apply(self, [x, s], [x.type()])
+
+    def perform(self, node, inputs, outputs):
+        (x, s) = inputs
+        (z,) = outputs
+        M, N = x.shape
+        assert x.format == "csr"
+        assert s.shape == (N,)
+
+        indices = x.indices
+        indptr = x.indptr
+
+        # `indices` holds the column of each stored element
+        y_data = np.multiply(x.data, s[indices], dtype=x.dtype)
+
+        z[0] = scipy.sparse.csr_matrix((y_data, indices, indptr), (M, N))
+
+    def grad(self, inputs, gout):
+        (x, s) = inputs
+        (gz,) = gout
+        return [col_scale(gz, s), sp_sum(x * gz, axis=0)]
+
+    def infer_shape(self, fgraph, node, ins_shapes):
+        return [ins_shapes[0]]
+
+
+class RowScaleCSR(Op):
+    # Scale each row of a sparse matrix by the corresponding element of
+    # a dense vector
+
+    # :param x: A sparse matrix.
+    # :param s: A dense vector with length equal to the number
+    #           of rows of `x`.
+
+    # :return: A sparse matrix in the same format as `x` which
+    #          each row had been multiply by the corresponding
+    #          element of `s`.
+
+    # :note: The grad implemented is structured.
+
+    view_map = {0: [0]}
+    __props__ = ()
+
+    def make_node(self, x, s):
+        if x.format != "csr":
+            raise ValueError("x was not a csr matrix")
+        return Apply(self, [x, s], [x.type()])
+
+    def perform(self, node, inputs, outputs):
+        (x, s) = inputs
+        (z,) = outputs
+        M, N = x.shape
+        assert x.format == "csr"
+        assert s.shape == (M,)
+
+        # Row of each stored element
+        rows = _expand_indptr(x.indptr)
+        y_data = np.multiply(x.data, s[rows], dtype=x.dtype)
+
+        z[0] = scipy.sparse.csr_matrix((y_data, x.indices, x.indptr), (M, N))
+
+    def grad(self, inputs, gout):
+        (x, s) = inputs
+        (gz,) = gout
+        return [row_scale(gz, s), sp_sum(x * gz, axis=1)]
+
+    def infer_shape(self, fgraph, node, ins_shapes):
+        return [ins_shapes[0]]
+
+
 def col_scale(x, s):
     """
     Scale each columns of a sparse matrix by the corresponding element of a
@@ -1695,7 +1834,7 @@ def col_scale(x, s):
     if x.format == "csc":
         return ColScaleCSC()(x, s)
     elif x.format == "csr":
-        return RowScaleCSC()(x.T, s).T
+        return ColScaleCSR()(x, s)
     else:
         raise NotImplementedError()
 
@@ -1723,7 +1862,12 @@ def row_scale(x, s):
     The grad implemented is structured.
 
     """
-    return col_scale(x.T, s).T
+    if x.format == "csc":
+        return RowScaleCSC()(x, s)
+    elif x.format == "csr":
+        return RowScaleCSR()(x, s)
+    else:
+        raise NotImplementedError()
 
 
 class SpSum(Op):
@@ -1747,7 +1891,10 @@ class SpSum(Op):
 
     def make_node(self, x):
         x = as_sparse_variable(x)
-        assert x.format in ("csr", "csc")
+        if x.format not in ("csr", "csc"):
+            raise NotImplementedError(
+                f"SpSum is only implemented for csr and csc matrices, got {x.format}"
+            )
 
         if self.axis is not None:
             out_shape = (None,)
@@ -1760,15 +1907,37 @@ class SpSum(Op):
     def perform(self, node, inputs, outputs):
         (x,) = inputs
         (z,) = outputs
+        dtype = node.outputs[0].dtype
         if self.axis is None:
-            z[0] = np.asarray(x.sum())
+            # Only the stored elements contribute to the sum
+            z[0] = np.asarray(x.data[: x.indptr[-1]].sum(), dtype=dtype)
+        elif self.axis == (0 if x.format == "csc" else 1):
+            # Sum each compressed segment of the data. Like `ndarray.sum`,
+            # accumulate small integers in a wide integer type and cast only
+            # the final result.
+            data = x.data[: x.indptr[-1]]
+            kind = data.dtype.kind
+            if kind == "i":
+                acc_dtype = np.result_type(data.dtype, np.int64)
+            elif kind == "u":
+                acc_dtype = np.result_type(data.dtype, np.uint64)
+            else:
+                acc_dtype = data.dtype
+            counts = np.diff(x.indptr)
+            nonempty = counts > 0
+            res = np.zeros(len(counts), dtype=acc_dtype)
+            if nonempty.any():
+                res[nonempty] = np.add.reduceat(
+                    data, x.indptr[:-1][nonempty], dtype=acc_dtype
+                )
+            z[0] = res.astype(dtype, copy=False)
         else:
-            z[0] = np.asarray(x.sum(self.axis)).ravel()
+            z[0] = np.asarray(x.sum(self.axis), dtype=dtype).ravel()
 
     def grad(self, inputs, gout):
         (x,) = inputs
         (gz,) = gout
-        if x.dtype not in continuous_dtypes:
+        if x.dtype not in _continuous_dtypes:
             return [x.zeros_like(dtype=config.floatX)]
         if self.structured:
             if self.axis is None:
@@ -1922,12 +2091,12 @@ class SquareDiagonal(Op):
         diag = inputs[0]
 
         N = len(diag)
-        data = diag[:N]
-        indices = list(range(N))
-        indptr = list(range(N + 1))
-        tup = (data, indices, indptr)
+        # Only the data needs to be copied, the index arrays are new
+        indices = np.arange(N, dtype=np.int32)
+        indptr = np.arange(N + 1, dtype=np.int32)
+        tup = (diag.copy(), indices, indptr)
 
-        z[0] = scipy.sparse.csc_matrix(tup, copy=True)
+        z[0] = scipy.sparse.csc_matrix(tup, shape=(N, N), copy=False)
 
     def grad(self, inputs, gout):
         (gz,) = gout
@@ -1955,11 +2124,11 @@ class EnsureSortedIndices(Op):
     """
 
     __props__ = ("inplace",)
+    # Already sorted inputs are returned as-is
+    view_map = {0: [0]}
 
     def __init__(self, inplace):
         self.inplace = inplace
-        if self.inplace:
-            self.view_map = {0: [0]}
 
     def make_node(self, x):
         """
@@ -1976,8 +2145,11 @@ class EnsureSortedIndices(Op):
     def perform(self, node, inputs, outputs):
         (x,) = inputs
         (z,) = outputs
-        if self.inplace:
-            z[0] = x.sort_indices()
+        if x.has_sorted_indices:
+            z[0] = x
+        elif self.inplace:
+            x.sort_indices()
+            z[0] = x
         else:
             z[0] = x.sorted_indices()
 
@@ -1997,6 +2169,54 @@ class EnsureSortedIndices(Op):
 ensure_sorted_indices = EnsureSortedIndices(inplace=False)
 
 
+class SumDuplicates(Op):
+    """Put a sparse matrix in canonical format.
+
+    Duplicated entries are summed together and the indices are sorted. Use
+    `sum_duplicates` before working directly on the stored data of a matrix
+    whose entries must be unique (e.g. applying a non-linear function to it).
+
+    Notes
+    -----
+    The grad implemented is regular, i.e. not structured.
+
+    """
+
+    __props__ = ()
+    # Matrices already in canonical format are returned as-is
+    view_map = {0: [0]}
+
+    def make_node(self, x):
+        """
+        Parameters
+        ----------
+        x
+            A sparse matrix.
+
+        """
+        x = as_sparse_variable(x)
+        assert x.format in ("csr", "csc")
+        return Apply(self, [x], [x.type()])
+
+    def perform(self, node, inputs, outputs):
+        (x,) = inputs
+        (z,) = outputs
+        if x.has_canonical_format:
+            z[0] = x
+        else:
+            z[0] = x.copy()
+            z[0].sum_duplicates()
+
+    def grad(self, inputs, output_grad):
+        return [output_grad[0]]
+
+    def infer_shape(self, fgraph, node, i0_shapes):
+        return i0_shapes
+
+
+sum_duplicates = SumDuplicates()
+
+
 def clean(x):
     """
     Remove explicit zeros from a sparse matrix, and re-sort indices.
@@ -2060,6 +2280,41 @@ class AddSS(Op):
 add_s_s = AddSS()
 
 
+class SubSS(Op):
+    # sub(sparse, sparse).
+    # see the doc of sub() for more detail.
+    __props__ = ()
+
+    def make_node(self, x, y):
+        x, y = map(as_sparse_variable, [x, y])
+        assert x.format in ("csr", "csc")
+        assert y.format in ("csr", "csc")
+        out_dtype = ps.upcast(x.type.dtype, y.type.dtype)
+        return Apply(
+            self, [x, y], [SparseTensorType(dtype=out_dtype, format=x.type.format)()]
+        )
+
+    def perform(self, node, inputs, outputs):
+        (x, y) = inputs
+        (out,) = outputs
+        assert _is_sparse(x) and _is_sparse(y)
+        assert x.shape == y.shape
+        out[0] = x - y
+
+    def grad(self, inputs, gout):
+        (x, y) = inputs
+        (gz,) = gout
+        assert _is_sparse_variable(x) and _is_sparse_variable(y)
+        assert _is_sparse_variable(gz)
+        return gz, -gz
+
+    def infer_shape(self, fgraph, node, shapes):
+        return [shapes[0]]
+
+
+sub_s_s = SubSS()
+
+
 class AddSSData(Op):
     """Add two sparse matrices assuming they have the same sparsity pattern.
 
@@ -2070,6 +2325,8 @@ class AddSSData(Op):
     """
 
     __props__ = ()
+    # The output shares the indices and indptr of `x`
+    view_map = {0: [0]}
 
     def make_node(self, x, y):
         """
@@ -2103,12 +2360,11 @@ class AddSSData(Op):
         assert _is_sparse(x) and _is_sparse(y)
         assert x.shape == y.shape
         assert x.data.shape == y.data.shape
-        out[0] = x.copy()
-        out[0].data += y.data
+        out[0] = type(x)((x.data + y.data, x.indices, x.indptr), x.shape, copy=False)
 
     def grad(self, inputs, gout):
         (gz,) = gout
-        is_continuous = [(i.dtype in continuous_dtypes) for i in inputs]
+        is_continuous = [(i.dtype in _continuous_dtypes) for i in inputs]
         derivative = {True: gz, False: None}
         return [derivative[b] for b in is_continuous]
 
@@ -2175,6 +2431,7 @@ class StructuredAddSV(Op):
     """
 
     __props__ = ()
+    view_map = {0: [0]}
 
     def make_node(self, x, y):
         """
@@ -2203,7 +2460,15 @@ class StructuredAddSV(Op):
         (out,) = outputs
         assert _is_sparse(x) and not _is_sparse(y)
         assert x.shape[1] == y.shape[0]
-        out[0] = x.__class__(x + (x.toarray() != 0) * y)
+        if not x.has_canonical_format:
+            x = x.copy()
+            x.sum_duplicates()
+        if x.format == "csr":
+            cols = x.indices
+        else:
+            cols = _expand_indptr(x.indptr)
+        data = x.data + np.where(x.data != 0, y[cols], 0).astype(x.dtype)
+        out[0] = x.__class__((data, x.indices, x.indptr), shape=x.shape, copy=False)
 
     def grad(self, inputs, gout):
         (x, y) = inputs
@@ -2219,6 +2484,24 @@ class StructuredAddSV(Op):
 structured_add_s_v = StructuredAddSV()
 
 
+def _sparse_or_dense_inputs(x, y):
+    """Convert the operands of a binary sparse operation to variables.
+
+    Returns the two variables, followed by whether each one is sparse.
+
+    """
+    if not isinstance(x, Variable):
+        x = as_sparse_variable(x) if hasattr(x, "getnnz") else ptb.as_tensor_variable(x)
+    if not isinstance(y, Variable):
+        y = as_sparse_variable(y) if hasattr(y, "getnnz") else ptb.as_tensor_variable(y)
+    return (
+        x,
+        y,
+        isinstance(x.type, SparseTensorType),
+        isinstance(y.type, SparseTensorType),
+    )
+
+
 def add(x, y):
     """
     Add two matrices, at least one of which is sparse.
@@ -2247,17 +2530,7 @@ def add(x, y):
 
     """
 
-    if hasattr(x, "getnnz"):
-        x = as_sparse_variable(x)
-    if hasattr(y, "getnnz"):
-        y = as_sparse_variable(y)
-    if not isinstance(x, Variable):
-        x = ptb.as_tensor_variable(x)
-    if not isinstance(y, Variable):
-        y = ptb.as_tensor_variable(y)
-
-    x_is_sparse_variable = _is_sparse_variable(x)
-    y_is_sparse_variable = _is_sparse_variable(y)
+    x, y, x_is_sparse_variable, y_is_sparse_variable = _sparse_or_dense_inputs(x, y)
 
     assert x_is_sparse_variable or y_is_sparse_variable
     if x_is_sparse_variable and y_is_sparse_variable:
@@ -2297,6 +2570,11 @@ def sub(x, y):
     matrix.
 
     """
+    x, y, x_is_sparse_variable, y_is_sparse_variable = _sparse_or_dense_inputs(x, y)
+
+    assert x_is_sparse_variable or y_is_sparse_variable
+    if x_is_sparse_variable and y_is_sparse_variable:
+        return sub_s_s(x, y)
     return x + (-y)
 
 
@@ -2340,6 +2618,7 @@ class MulSD(Op):
     # mul(sparse, dense)
     # See the doc of mul() for more detail
     __props__ = ()
+    view_map = {0: [0]}
 
     def make_node(self, x, y):
         x, y = as_sparse_variable(x), ptb.as_tensor_variable(y)
@@ -2363,55 +2642,23 @@ class MulSD(Op):
         assert _is_sparse(x) and _is_dense(y)
         if len(y.shape) == 0:
             out_dtype = node.outputs[0].dtype
-            if x.dtype == out_dtype:
-                z = x.copy()
-            else:
-                z = x.astype(out_dtype)
-            out[0] = z
-            out[0].data *= y
+            z_data = np.multiply(x.data, y, dtype=out_dtype)
+            out[0] = type(x)((z_data, x.indices, x.indptr), x.shape, copy=False)
         elif len(y.shape) == 1:
             raise NotImplementedError()  # RowScale / ColScale
         elif len(y.shape) == 2:
-            # if we have enough memory to fit y, maybe we can fit x.asarray()
-            # too?
-            # TODO: change runtime from O(M*N) to O(nonzeros)
-            M, N = x.shape
             assert x.shape == y.shape
+            assert x.format in ("csr", "csc")
             out_dtype = node.outputs[0].dtype
 
-            if x.format == "csc":
-                indices = x.indices
-                indptr = x.indptr
-                if x.dtype == out_dtype:
-                    z = x.copy()
-                else:
-                    z = x.astype(out_dtype)
-                z_data = z.data
-
-                for j in range(0, N):
-                    for i_idx in range(indptr[j], indptr[j + 1]):
-                        i = indices[i_idx]
-                        z_data[i_idx] *= y[i, j]
-                out[0] = z
-            elif x.format == "csr":
-                indices = x.indices
-                indptr = x.indptr
-                if x.dtype == out_dtype:
-                    z = x.copy()
-                else:
-                    z = x.astype(out_dtype)
-                z_data = z.data
-
-                for i in range(0, M):
-                    for j_idx in range(indptr[i], indptr[i + 1]):
-                        j = indices[j_idx]
-                        z_data[j_idx] *= y[i, j]
-                out[0] = z
+            # Gather the elements of `y` at the stored positions of `x`
+            major = _expand_indptr(x.indptr)
+            if x.format == "csr":
+                y_data = y[major, x.indices]
             else:
-                warn(
-                    "This implementation of MulSD is deficient: {x.format}",
-                )
-                out[0] = type(x)(x.toarray() * y)
+                y_data = y[x.indices, major]
+            z_data = np.multiply(x.data, y_data, dtype=out_dtype)
+            out[0] = type(x)((z_data, x.indices, x.indptr), x.shape, copy=False)
 
     def grad(self, inputs, gout):
         (x, y) = inputs
@@ -2437,6 +2684,7 @@ class MulSV(Op):
     """
 
     __props__ = ()
+    view_map = {0: [0]}
 
     def make_node(self, x, y):
         """
@@ -2468,7 +2716,12 @@ class MulSV(Op):
         (out,) = outputs
         assert _is_sparse(x) and not _is_sparse(y)
         assert x.shape[1] == y.shape[0]
-        out[0] = x.__class__(x.toarray() * y)
+        if x.format == "csr":
+            cols = x.indices
+        else:
+            cols = _expand_indptr(x.indptr)
+        data = x.data * y[cols]
+        out[0] = x.__class__((data, x.indices, x.indptr), shape=x.shape, copy=False)
 
     def grad(self, inputs, gout):
         (x, y) = inputs
@@ -2518,11 +2771,7 @@ def mul(x, y):
 
     """
 
-    x = as_sparse_or_tensor_variable(x)
-    y = as_sparse_or_tensor_variable(y)
-
-    x_is_sparse_variable = _is_sparse_variable(x)
-    y_is_sparse_variable = _is_sparse_variable(y)
+    x, y, x_is_sparse_variable, y_is_sparse_variable = _sparse_or_dense_inputs(x, y)
 
     assert x_is_sparse_variable or y_is_sparse_variable
     if x_is_sparse_variable and y_is_sparse_variable:
@@ -2659,21 +2908,7 @@ def __ComparisonSwitch(SS, SD, DS):
     """
 
     def helper(x, y):
-        scipy_ver = [int(n) for n in scipy.__version__.split(".")[:2]]
-
-        assert scipy_ver >= [0, 13]
-
-        if hasattr(x, "getnnz"):
-            x = as_sparse_variable(x)
-        if hasattr(y, "getnnz"):
-            y = as_sparse_variable(y)
-        if not isinstance(x, Variable):
-            x = ptb.as_tensor_variable(x)
-        if not isinstance(y, Variable):
-            y = ptb.as_tensor_variable(y)
-
-        x_is_sparse_variable = _is_sparse_variable(x)
-        y_is_sparse_variable = _is_sparse_variable(y)
+        x, y, x_is_sparse_variable, y_is_sparse_variable = _sparse_or_dense_inputs(x, y)
 
         assert x_is_sparse_variable or y_is_sparse_variable
         if x_is_sparse_variable and y_is_sparse_variable:
@@ -2825,11 +3060,9 @@ class HStack(Op):
         (out,) = outputs
         for b in block:
             assert _is_sparse(b)
+        # When all blocks are in the output format, scipy concatenates the
+        # compressed arrays directly and casts with `astype(copy=False)`
         out[0] = scipy.sparse.hstack(block, format=self.format, dtype=self.dtype)
-        # Some version of scipy (at least 0.14.0.dev-c4314b0)
-        # Do not cast to the wanted dtype.
-        if out[0].dtype != self.dtype:
-            out[0] = out[0].astype(self.dtype)
 
     def grad(self, inputs, gout):
         (gz,) = gout
@@ -2893,8 +3126,9 @@ def hstack(blocks, format=None, dtype=None):
 
     """
 
-    blocks = [as_sparse_variable(i) for i in blocks]
+    # `make_node` converts the blocks, only do it here when the dtype is needed
     if dtype is None:
+        blocks = [as_sparse_variable(i) for i in blocks]
         dtype = ps.upcast(*[i.dtype for i in blocks])
     return HStack(format=format, dtype=dtype)(*blocks)
 
@@ -2904,11 +3138,9 @@ class VStack(HStack):
         (out,) = outputs
         for b in block:
             assert _is_sparse(b)
+        # When all blocks are in the output format, scipy concatenates the
+        # compressed arrays directly and casts with `astype(copy=False)`
         out[0] = scipy.sparse.vstack(block, format=self.format, dtype=self.dtype)
-        # Some version of scipy (at least 0.14.0.dev-c4314b0)
-        # Do not cast to the wanted dtype.
-        if out[0].dtype != self.dtype:
-            out[0] = out[0].astype(self.dtype)
 
     def grad(self, inputs, gout):
         (gz,) = gout
@@ -2969,8 +3201,9 @@ def vstack(blocks, format=None, dtype=None):
 
     """
 
-    blocks = [as_sparse_variable(i) for i in blocks]
+    # `make_node` converts the blocks, only do it here when the dtype is needed
     if dtype is None:
+        blocks = [as_sparse_variable(i) for i in blocks]
         dtype = ps.upcast(*[i.dtype for i in blocks])
     return VStack(format=format, dtype=dtype)(*blocks)
 
@@ -3281,7 +3514,7 @@ def _conj(x):
 
 def conjugate(x):
     _x = as_sparse_variable(x)
-    if _x.type.dtype not in complex_dtypes:
+    if _x.type.dtype not in _complex_dtypes:
         return _x
     return _conj(_x)
 
@@ -3343,7 +3576,8 @@ class TrueDot(Op):
         # 'ushort', 'intc', 'uintc', 'longlong', 'ulonglong', 'single',
         # 'double', 'longdouble', 'csingle', 'cdouble', 'clongdouble']
         # But ulonglong is uint64 on x86-64, but with a different typenum!
-        if rval.dtype.num != np.dtype(str(rval.dtype)).num:
+        # Only integer types can have such an alias.
+        if rval.dtype.kind in "iu" and rval.dtype.num != np.dtype(str(rval.dtype)).num:
             assert str(rval.dtype) == node.outputs[0].dtype
             # Create a view with the expected typenum.
             format = node.outputs[0].type.format
@@ -3498,9 +3732,8 @@ class StructuredDot(Op):
                     f"a.shape={a.shape}, b.shape={b.shape}, variable.shape={variable.shape}?"
                 )
 
-        # The cast is needed as otherwise we hit the bug mentioned into
-        # _asarray function documentation.
-        out[0] = np.asarray(variable, str(variable.dtype))
+        # This doesn't copy when scipy already returned the output dtype
+        out[0] = np.asarray(variable, dtype=node.outputs[0].type.dtype)
 
     def grad(self, inputs, gout):
         # a is sparse, b is dense, g_out is dense
@@ -3568,7 +3801,36 @@ def structured_dot(x, y):
         return _structured_dot(y.T, x.T).T
 
 
-class StructuredDotGradCSC(COp):
+def _structured_dot_grad_data(g_ab, g_rows, b, b_rows, block_size=2**20, dtype=None):
+    """Compute ``(g_ab[g_rows] * b[b_rows]).sum(axis=1)``.
+
+    This is the data of the structured gradient of ``dot(a, b)`` with respect
+    to `a`, where `g_rows` and `b_rows` are the row and column of each stored
+    element of `a`. The dense rows are gathered by blocks of at most
+    `block_size` elements, so the temporaries stay bounded. The result has
+    the dtype of `g_ab` unless `dtype` is given.
+
+    """
+    out = np.zeros(g_rows.shape, dtype=g_ab.dtype if dtype is None else dtype)
+    if _is_sparse(g_ab) or _is_sparse(b):
+        g_gathered, b_gathered = g_ab[g_rows], b[b_rows]
+        if _is_sparse(g_gathered):
+            prod = g_gathered.multiply(b_gathered)
+        else:
+            prod = b_gathered.multiply(g_gathered)
+        out[:] = np.asarray(prod.sum(axis=1)).ravel()
+        return out
+
+    step = max(1, block_size // max(1, b.shape[1]))
+    for start in range(0, len(g_rows), step):
+        stop = start + step
+        out[start:stop] = np.einsum(
+            "ij,ij->i", g_ab[g_rows[start:stop]], b[b_rows[start:stop]]
+        )
+    return out
+
+
+class StructuredDotGradCSC(OpenMPOp):
     # Op that produces the grad of StructuredDot.
 
     # :param a_indices: Matrix indices
@@ -3582,7 +3844,7 @@ class StructuredDotGradCSC(COp):
     # :note: The grad implemented is structured.
     # :note: a_* are the corresponding properties of a sparse
     #        matrix in csc format.
-    __props__ = ()
+    __props__ = ("openmp",)
 
     def make_node(self, a_indices, a_indptr, b, g_ab):
         return Apply(
@@ -3594,23 +3856,12 @@ class StructuredDotGradCSC(COp):
     def perform(self, node, inputs, outputs):
         (a_indices, a_indptr, b, g_ab) = inputs
         (out,) = outputs
-        g_a_data = np.zeros(a_indices.shape, dtype=g_ab.dtype)
-        for j in range(len(a_indptr) - 1):
-            ind0 = a_indptr[j]
-            ind1 = a_indptr[j + 1]
-            for i_idx in range(ind0, ind1):
-                i = a_indices[i_idx]
-                # Depending on the type of g_ab and b (sparse or dense),
-                # the following dot product can result in a scalar or
-                # a (1, 1) sparse matrix.
-                dot_val = np.dot(g_ab[i], b[j].T)
-                if isinstance(dot_val, scipy.sparse.spmatrix):
-                    dot_val = dot_val[0, 0]
-                g_a_data[i_idx] = dot_val
-        out[0] = g_a_data
+        # The major axis of `a` indexes the rows of `b`
+        cols = _expand_indptr(a_indptr)
+        out[0] = _structured_dot_grad_data(g_ab, a_indices, b, cols)
 
     def c_code_cache_version(self):
-        return (2,)
+        return (7, self.openmp, int(config.openmp_elemwise_minsize))
 
     def c_code(self, node, name, inputs, outputs, sub):
         (_indices, _indptr, _d, _g) = inputs
@@ -3621,6 +3872,10 @@ class StructuredDotGradCSC(COp):
             raise NotImplementedError("Complex types are not supported for g_ab")
 
         fail = sub["fail"]
+        omp = ""
+        if self.openmp:
+            # Each iteration writes a disjoint slice of `zout`
+            omp = f"#pragma omp parallel for schedule(dynamic, 64) if(nnz >= {int(config.openmp_elemwise_minsize)})"
         return f"""
         if (PyArray_NDIM({_d}) != 2) {{PyErr_SetString(PyExc_NotImplementedError, "rank(d) != 2"); {fail};}}
         if (PyArray_NDIM({_g}) != 2) {{PyErr_SetString(PyExc_NotImplementedError, "rank(g) != 2"); {fail};}}
@@ -3658,15 +3913,31 @@ class StructuredDotGradCSC(COp):
             const npy_int32 * __restrict__ indptr = (npy_int32 *)PyArray_DATA({_indptr});
             const npy_int32 * __restrict__ indices = (npy_int32 *)PyArray_DATA({_indices});
 
+            // Check the bounds up front, a parallel loop can't jump to `fail`
+            if (N > PyArray_DIMS({_d})[0])
+            {{PyErr_SetString(PyExc_NotImplementedError, "G"); {fail};}}
+            for (npy_intp i_idx = indptr[0]; i_idx < indptr[N * Sindptr]; ++i_idx)
+            {{
+                if (indices[i_idx * Sindices] >= PyArray_DIMS({_g})[0])
+                {{PyErr_SetString(PyExc_NotImplementedError, "H"); {fail};}}
+            }}
+
+            // The loop only touches array buffers
+            Py_BEGIN_ALLOW_THREADS
             // loop over columns
-            for (npy_int32 j = 0; j < N; ++j)
+            {omp}
+            for (npy_intp j = 0; j < N; ++j)
             {{
+                const npy_int32 lo = indptr[j * Sindptr];
+                const npy_int32 hi = indptr[(j+1) * Sindptr];
+                // skip empty columns, common in hypersparse matrices
+                if (lo == hi) continue;
+
                 // extract j-th row of dense matrix
                 const dtype_{_d}* __restrict__ d_row = (dtype_{_d}*)(PyArray_BYTES({_d}) + PyArray_STRIDES({_d})[0] * j);
-                if(j >= PyArray_DIMS({_d})[0]) {{PyErr_SetString(PyExc_NotImplementedError, "G"); {fail};}}
 
                 // for each non-null value in the sparse column
-                for (npy_int32 i_idx = indptr[j * Sindptr]; i_idx < indptr[(j+1) * Sindptr]; ++i_idx)
+                for (npy_int32 i_idx = lo; i_idx < hi; ++i_idx)
                 {{
                     // extract row index of non-null value
                     npy_int32 i = indices[i_idx * Sindices];
@@ -3675,22 +3946,42 @@ class StructuredDotGradCSC(COp):
                     const dtype_{_g}* __restrict__ g_row = (dtype_{_g}*)(PyArray_BYTES({_g}) + PyArray_STRIDES({_g})[0] * i);
                     double ip = 0.0;
 
-                    // make sure that row index is not bigger than actual number of rows
-                    // Note: wouldn't the above operation fail if that were the case ?
-                    //       when would this ever be true anyway ?
-                    if (i >= PyArray_DIMS({_g})[0])
-                    {{PyErr_SetString(PyExc_NotImplementedError, "H"); {fail};}}
-
-                    // perform dot product of dense and sparse rows
-                    for(int k = 0; k < K; ++k)
+                    // perform dot product of dense and sparse rows, with
+                    // independent partial sums to break the dependency chain
+                    double ip0 = 0.0, ip1 = 0.0, ip2 = 0.0, ip3 = 0.0;
+                    npy_intp k = 0;
+                    if (Sd1 == 1 && Sg1 == 1)
+                    {{
+                        // Contiguous rows, that the compiler can vectorize
+                        for(; k + 4 <= K; k += 4)
+                        {{
+                            ip0 += d_row[k] * g_row[k];
+                            ip1 += d_row[k + 1] * g_row[k + 1];
+                            ip2 += d_row[k + 2] * g_row[k + 2];
+                            ip3 += d_row[k + 3] * g_row[k + 3];
+                        }}
+                    }}
+                    else
+                    {{
+                        for(; k + 4 <= K; k += 4)
+                        {{
+                            ip0 += d_row[k * Sd1] * g_row[k * Sg1];
+                            ip1 += d_row[(k + 1) * Sd1] * g_row[(k + 1) * Sg1];
+                            ip2 += d_row[(k + 2) * Sd1] * g_row[(k + 2) * Sg1];
+                            ip3 += d_row[(k + 3) * Sd1] * g_row[(k + 3) * Sg1];
+                        }}
+                    }}
+                    for(; k < K; ++k)
                     {{
-                        ip += d_row[k * Sd1] * g_row[k*Sg1];
+                        ip0 += d_row[k * Sd1] * g_row[k * Sg1];
                     }}
+                    ip = (ip0 + ip1) + (ip2 + ip3);
 
                     // write resulting gradient to sparse output
                     ((dtype_{_zout}* __restrict__)(PyArray_BYTES({_zout}) + i_idx * PyArray_STRIDES({_zout})[0]))[0] = ip;
                 }}
             }}
+            Py_END_ALLOW_THREADS
         }}
 
         """
@@ -3702,7 +3993,7 @@ class StructuredDotGradCSC(COp):
 sdg_csc = StructuredDotGradCSC()
 
 
-class StructuredDotGradCSR(COp):
+class StructuredDotGradCSR(OpenMPOp):
     # Op that produces the grad of StructuredDot.
 
     # :param a_indices: Matrix indices
@@ -3716,7 +4007,7 @@ class StructuredDotGradCSR(COp):
     # :note: The grad implemented is structured.
     # :note: a_* are the corresponding properties of a sparse
     #        matrix in csr format.
-    __props__ = ()
+    __props__ = ("openmp",)
 
     def make_node(self, a_indices, a_indptr, b, g_ab):
         return Apply(
@@ -3726,25 +4017,12 @@ class StructuredDotGradCSR(COp):
     def perform(self, node, inputs, outputs):
         (a_indices, a_indptr, b, g_ab) = inputs
         (out,) = outputs
-        g_a_data = np.zeros(a_indices.shape, dtype=g_ab.dtype)
-        for i in range(len(a_indptr) - 1):  # loop over rows
-            ind0 = a_indptr[i]
-            ind1 = a_indptr[i + 1]
-            # loop over values in that row (columns)
-            for j_idx in range(ind0, ind1):
-                j = a_indices[j_idx]
-                # grad is dot product of i-th row of gradient with j-th row of b
-                # Depending on the type of g_ab and b (sparse or dense),
-                # the following dot product can result in a scalar or
-                # a (1, 1) sparse matrix.
-                dot_val = np.dot(g_ab[i], b[j].T)
-                if isinstance(dot_val, scipy.sparse.spmatrix):
-                    dot_val = dot_val[0, 0]
-                g_a_data[j_idx] = dot_val
-        out[0] = g_a_data
+        # The major axis of `a` indexes the rows of `g_ab`
+        rows = _expand_indptr(a_indptr)
+        out[0] = _structured_dot_grad_data(g_ab, rows, b, a_indices)
 
     def c_code_cache_version(self):
-        return (2,)
+        return (6, self.openmp, int(config.openmp_elemwise_minsize))
 
     def c_code(self, node, name, inputs, outputs, sub):
         (_indices, _indptr, _d, _g) = inputs
@@ -3755,6 +4033,10 @@ class StructuredDotGradCSR(COp):
             raise NotImplementedError("Complex types are not supported for g_ab")
 
         fail = sub["fail"]
+        omp = ""
+        if self.openmp:
+            # Each iteration writes a disjoint slice of `zout`
+            omp = f"#pragma omp parallel for schedule(dynamic, 64) if(nnz >= {int(config.openmp_elemwise_minsize)})"
         return f"""
         if (PyArray_NDIM({_d}) != 2) {{PyErr_SetString(PyExc_NotImplementedError, "rank(d) != 2"); {fail};}}
         if (PyArray_NDIM({_g}) != 2) {{PyErr_SetString(PyExc_NotImplementedError, "rank(g) != 2"); {fail};}}
@@ -3793,8 +4075,23 @@ class StructuredDotGradCSR(COp):
             const npy_int32 * __restrict__ indptr = (npy_int32 *)PyArray_DATA({_indptr});
             const npy_int32 * __restrict__ indices = (npy_int32 *)PyArray_DATA({_indices});
 
-            // loop over columns of sparse matrix
-            for (npy_int32 i = 0; i < N; ++i)
+            // Check the bounds up front, a parallel loop can't jump to `fail`
+            for (npy_intp i_idx = indptr[0]; i_idx < indptr[N * Sindptr]; ++i_idx)
+            {{
+                if (indices[i_idx * Sindices] >= PyArray_DIMS({_d})[0])
+                {{PyErr_SetString(PyExc_NotImplementedError, "G"); {fail};}}
+            }}
+            for (npy_intp i = PyArray_DIMS({_g})[0]; i < N; ++i)
+            {{
+                if (indptr[i * Sindptr] < indptr[(i+1) * Sindptr])
+                {{PyErr_SetString(PyExc_NotImplementedError, "H"); {fail};}}
+            }}
+
+            // The loop only touches array buffers
+            Py_BEGIN_ALLOW_THREADS
+            // loop over rows of sparse matrix
+            {omp}
+            for (npy_intp i = 0; i < N; ++i)
             {{
                 // for each non-null value in the sparse row
                 for (npy_int32 j_idx = indptr[i * Sindptr]; j_idx < indptr[(i+1) * Sindptr]; ++j_idx)
@@ -3804,28 +4101,47 @@ class StructuredDotGradCSR(COp):
 
                     // extract j-th row of dense matrix
                     const dtype_{_d}* __restrict__ d_row = (dtype_{_d}*)(PyArray_BYTES({_d}) + PyArray_STRIDES({_d})[0] * j);
-                    if(j >= PyArray_DIMS({_d})[0]) {{PyErr_SetString(PyExc_NotImplementedError, "G"); {fail};}}
 
                     // extract corresponding row in gradient
                     const dtype_{_g}* __restrict__ g_row = (dtype_{_g}*)(PyArray_BYTES({_g}) + PyArray_STRIDES({_g})[0] * i);
                     double ip = 0.0;
 
-                    // make sure that row index is not bigger than actual number of rows
-                    // Note: wouldn't the above operation fail if that were the case ?
-                    //       when would this ever be true anyway ?
-                    if (i >= PyArray_DIMS({_g})[0])
-                    {{PyErr_SetString(PyExc_NotImplementedError, "H"); {fail};}}
-
-                    // perform dot product of dense and sparse rows
-                    for(int k = 0; k < K; ++k)
+                    // perform dot product of dense and sparse rows, with
+                    // independent partial sums to break the dependency chain
+                    double ip0 = 0.0, ip1 = 0.0, ip2 = 0.0, ip3 = 0.0;
+                    npy_intp k = 0;
+                    if (Sd1 == 1 && Sg1 == 1)
+                    {{
+                        // Contiguous rows, that the compiler can vectorize
+                        for(; k + 4 <= K; k += 4)
+                        {{
+                            ip0 += d_row[k] * g_row[k];
+                            ip1 += d_row[k + 1] * g_row[k + 1];
+                            ip2 += d_row[k + 2] * g_row[k + 2];
+                            ip3 += d_row[k + 3] * g_row[k + 3];
+                        }}
+                    }}
+                    else
                     {{
-                        ip += d_row[k * Sd1] * g_row[k*Sg1];
+                        for(; k + 4 <= K; k += 4)
+                        {{
+                            ip0 += d_row[k * Sd1] * g_row[k * Sg1];
+                            ip1 += d_row[(k + 1) * Sd1] * g_row[(k + 1) * Sg1];
+                            ip2 += d_row[(k + 2) * Sd1] * g_row[(k + 2) * Sg1];
+                            ip3 += d_row[(k + 3) * Sd1] * g_row[(k + 3) * Sg1];
+                        }}
                     }}
+                    for(; k < K; ++k)
+                    {{
+                        ip0 += d_row[k * Sd1] * g_row[k * Sg1];
+                    }}
+                    ip = (ip0 + ip1) + (ip2 + ip3);
 
                     // write resulting gradient to sparse output
                     ((dtype_{_zout}* __restrict__)(PyArray_BYTES({_zout}) + j_idx * PyArray_STRIDES({_zout})[0]))[0] = ip;
                 }}
             }}
+            Py_END_ALLOW_THREADS
         }}
 
         """
@@ -3846,10 +4162,9 @@ def structured_dot_grad(sparse_A, dense_B, ga):
             sdgcsx = sdg_csr
             CSx = CSR
 
-        g_A_data = sdgcsx(csm_indices(sparse_A), csm_indptr(sparse_A), dense_B, ga)
-        return CSx(
-            g_A_data, csm_indices(sparse_A), csm_indptr(sparse_A), csm_shape(sparse_A)
-        )
+        _, indices, indptr, shape = csm_properties(sparse_A)
+        g_A_data = sdgcsx(indices, indptr, dense_B, ga)
+        return CSx(g_A_data, indices, indptr, shape)
     else:
         raise NotImplementedError()
 
@@ -3914,7 +4229,21 @@ class SamplingDot(Op):
         if not _is_sparse(p):
             raise TypeError(p)
 
-        out[0] = p.__class__(p.multiply(np.dot(x, y.T)))
+        if p.nnz >= 0.02 * np.prod(p.shape):
+            # Past a few percent of density, the BLAS dot is faster than the
+            # gathers below
+            out[0] = p.__class__(p.multiply(np.dot(x, y.T)))
+            return
+
+        # Only compute the elements of `dot(x, y.T)` selected by `p`
+        major = _expand_indptr(p.indptr)
+        if p.format == "csr":
+            rows, cols = major, p.indices
+        else:
+            rows, cols = p.indices, major
+        dtype = np.result_type(x.dtype, y.dtype)
+        data = _structured_dot_grad_data(x, rows, y, cols, dtype=dtype) * p.data
+        out[0] = p.__class__((data, p.indices.copy(), p.indptr.copy()), shape=p.shape)
 
     def grad(self, inputs, gout):
         (x, y, p) = inputs
@@ -4148,6 +4477,14 @@ class Usmm(Op):
 
         rval = x * y
         if isinstance(rval, scipy.sparse.spmatrix):
+            if rval.nnz < 0.03 * np.prod(rval.shape):
+                # Scatter a sparse enough product into a copy of `z`, instead
+                # of densifying it and making two more passes over the output.
+                # The product has no duplicate entries.
+                rval = rval.tocoo()
+                out[0] = np.array(z, dtype=node.outputs[0].type.dtype)
+                out[0][rval.row, rval.col] += alpha.reshape(()) * rval.data
+                return
             rval = rval.toarray()
         if rval.dtype == alpha.dtype:
             rval *= alpha  # Faster because operation is inplace
@@ -4204,7 +4541,7 @@ class ConstructSparseFromList(Op):
         values_ = ptb.as_tensor_variable(values)
         ilist_ = ptb.as_tensor_variable(ilist)
 
-        if ilist_.type.dtype not in integer_dtypes:
+        if ilist_.type.dtype not in _integer_dtypes:
             raise TypeError("index must be integers")
         if ilist_.type.ndim != 1:
             raise TypeError("index must be vector")
@@ -4228,13 +4565,17 @@ class ConstructSparseFromList(Op):
         (out,) = out_
         rows, cols = values.shape
         assert rows == len(ilist)
-        indptr = np.arange(cols + 1) * rows
-        indices = as_strided(
-            ilist, strides=(0, ilist.strides[0]), shape=(cols, ilist.shape[0])
-        ).flatten()
+        # Build the indices with the dtype scipy would pick, otherwise it
+        # checks and downcasts them again
+        if max(rows * cols, *out_shape) <= np.iinfo(np.int32).max:
+            idx_dtype = np.int32
+        else:
+            idx_dtype = np.int64
+        indptr = np.arange(cols + 1, dtype=idx_dtype) * idx_dtype(rows)
+        indices = np.tile(ilist.astype(idx_dtype, copy=False), cols)
         data = values.T.flatten()
         out[0] = scipy.sparse.csc_matrix(
-            (data, indices, indptr), shape=out_shape, dtype=values.dtype
+            (data, indices, indptr), shape=out_shape, copy=False
         )
 
     def infer_shape(self, fgraph, node, ishapes):
@@ -4343,7 +4684,10 @@ def block_diag(*matrices: TensorVariable, format: Literal["csc", "csr"] = "csc")
 
     """
     if len(matrices) == 1:
-        return matrices
+        # A single block is the matrix itself, as long as it needs no conversion
+        x = as_sparse_or_tensor_variable(matrices[0])
+        if _is_sparse_variable(x) and x.format == format:
+            return x
 
     _sparse_block_diagonal = SparseBlockDiagonal(n_inputs=len(matrices), format=format)
     return _sparse_block_diagonal(*matrices)
@@ -10,20 +10,18 @@ from pytensor.graph.rewriting.basic import (
     WalkingGraphRewriter,
     node_rewriter,
 )
-from pytensor.link.c.op import COp, _NoPythonCOp
+from pytensor.link.c.op import COp, OpenMPOp, _NoPythonCOp
 from pytensor.sparse import basic as sparse
 from pytensor.sparse.basic import (
     CSC,
     CSR,
-    csm_data,
     csm_grad,
-    csm_indices,
-    csm_indptr,
     csm_properties,
     usmm,
 )
 from pytensor.tensor import blas
 from pytensor.tensor.basic import as_tensor_variable, cast
+from pytensor.tensor.elemwise import Elemwise
 from pytensor.tensor.math import mul, neg, sub
 from pytensor.tensor.rewriting.basic import register_canonicalize, register_specialize
 from pytensor.tensor.shape import shape, specify_shape
@@ -120,7 +118,7 @@ class AddSD_ccode(_NoPythonCOp):
         if self.inplace:
             assert out_dtype == y.dtype
 
-        indices, indptr, data = csm_indices(x), csm_indptr(x), csm_data(x)
+        data, indices, indptr, _ = csm_properties(x)
         # We either use CSC or CSR depending on the format of input
         assert self.format == x.type.format
         # The magic number two here arises because L{scipy.sparse}
@@ -225,6 +223,95 @@ def local_dense_from_sparse_sparse_from_dense(fgraph, node):
             return inp.owner.inputs
 
 
+# Scalar ops that map 0 to 0, so they only need to be applied to the stored
+# elements of a sparse matrix
+_zero_preserving_scalar_ops = (
+    ps.Abs,
+    ps.ArcSin,
+    ps.ArcSinh,
+    ps.ArcTan,
+    ps.ArcTanh,
+    ps.Ceil,
+    ps.Deg2Rad,
+    ps.Expm1,
+    ps.Floor,
+    ps.Log1p,
+    ps.Neg,
+    ps.Rad2Deg,
+    ps.RoundHalfToEven,
+    ps.Sign,
+    ps.Sin,
+    ps.Sinh,
+    ps.Sqr,
+    ps.Sqrt,
+    ps.Tan,
+    ps.Tanh,
+    ps.Trunc,
+)
+
+
+@register_specialize
+@node_rewriter([Elemwise])
+def local_zero_preserving_elemwise_dense_from_sparse(fgraph, node):
+    """Apply zero-preserving unary `Elemwise` ops to the data of a sparse input.
+
+    ``f(dense_from_sparse(x))`` becomes
+    ``dense_from_sparse(CSM(f(csm_data(x)), csm_indices(x), ...))``, so that
+    ``f`` only runs over the stored elements instead of the whole dense matrix.
+    Duplicated entries of ``x`` are summed first, as ``f`` must see the value
+    of each element and not its parts.
+
+    """
+    if len(node.inputs) != 1 or not isinstance(
+        node.op.scalar_op, _zero_preserving_scalar_ops
+    ):
+        return None
+
+    [inp] = node.inputs
+    if not (inp.owner and isinstance(inp.owner.op, sparse.DenseFromSparse)):
+        return None
+
+    [x] = inp.owner.inputs
+    if x.format not in ("csc", "csr"):
+        return None
+
+    data, indices, indptr, shape = csm_properties(sparse.sum_duplicates(x))
+    csm = sparse.CSM(x.format)(node.op(data), indices, indptr, shape)
+    return [sparse.dense_from_sparse(csm)]
+
+
+@register_specialize
+@node_rewriter([sparse.Dot, sparse.StructuredDot])
+def local_dot_square_diagonal(fgraph, node):
+    """Replace a product with a `SquareDiagonal` matrix by a broadcasted multiply.
+
+    ``dot(square_diagonal(d), y)`` becomes ``d[:, None] * y`` and
+    ``dot(y, square_diagonal(d))`` becomes ``y * d`` when ``y`` is dense, so
+    the diagonal sparse matrix is never built.
+
+    """
+    x, y = node.inputs
+    if (
+        x.owner
+        and isinstance(x.owner.op, sparse.SquareDiagonal)
+        and not _is_sparse_variable(y)
+    ):
+        [diag] = x.owner.inputs
+        new_out = (diag[:, None] if y.type.ndim == 2 else diag) * y
+    elif (
+        y.owner
+        and isinstance(y.owner.op, sparse.SquareDiagonal)
+        and not _is_sparse_variable(x)
+    ):
+        [diag] = y.owner.inputs
+        new_out = x * diag
+    else:
+        return None
+
+    [out] = node.outputs
+    return [cast(new_out, out.type.dtype)]
+
+
 @node_rewriter([sparse.AddSD])
 def local_addsd_ccode(fgraph, node):
     """
@@ -1109,7 +1196,7 @@ def local_csm_grad_c(fgraph, node):
 # register_specialize(local_csm_grad_c, 'cxx_only')
 
 
-class MulSDCSC(_NoPythonCOp):
+class MulSDCSC(_NoPythonCOp, OpenMPOp):
     """Multiplication of sparse matrix by a broadcasted dense vector element-wise.
 
     Notes
@@ -1156,7 +1243,7 @@ class MulSDCSC(_NoPythonCOp):
         )
 
     def c_code_cache_version(self):
-        return (3,)
+        return (4, self.openmp, int(config.openmp_elemwise_minsize))
 
     def c_code(self, node, name, inputs, outputs, sub):
         (
@@ -1172,6 +1259,10 @@ class MulSDCSC(_NoPythonCOp):
             raise NotImplementedError("Complex types are not supported for b")
 
         fail = sub["fail"]
+        omp = ""
+        if self.openmp:
+            # Each iteration writes a disjoint slice of `zout`
+            omp = f"#pragma omp parallel for if(nnz >= {int(config.openmp_elemwise_minsize)})"
         return f"""
         if (PyArray_NDIM({_b}) != 2) {{
             PyErr_SetString(PyExc_NotImplementedError, "rank(b) != 2");
@@ -1221,6 +1312,7 @@ class MulSDCSC(_NoPythonCOp):
             const npy_intp Sb = PyArray_STRIDES({_b})[0];
 
             // loop over columns
+            {omp}
             for (npy_intp j = 0; j < N; ++j)
             {{
                 // for each non-null value in the sparse column
@@ -1247,7 +1339,7 @@ class MulSDCSC(_NoPythonCOp):
 mul_s_d_csc = MulSDCSC()
 
 
-class MulSDCSR(_NoPythonCOp):
+class MulSDCSR(_NoPythonCOp, OpenMPOp):
     """Multiplication of sparse matrix by a broadcasted dense vector element-wise.
 
     Notes
@@ -1294,7 +1386,7 @@ class MulSDCSR(_NoPythonCOp):
         )
 
     def c_code_cache_version(self):
-        return (3,)
+        return (4, self.openmp, int(config.openmp_elemwise_minsize))
 
     def c_code(self, node, name, inputs, outputs, sub):
         (
@@ -1310,6 +1402,10 @@ class MulSDCSR(_NoPythonCOp):
             raise NotImplementedError("Complex types are not supported for b")
 
         fail = sub["fail"]
+        omp = ""
+        if self.openmp:
+            # Each iteration writes a disjoint slice of `zout`
+            omp = f"#pragma omp parallel for if(nnz >= {int(config.openmp_elemwise_minsize)})"
         return f"""
         if (PyArray_NDIM({_b}) != 2) {{
             PyErr_SetString(PyExc_NotImplementedError, "rank(b) != 2");
@@ -1359,6 +1455,7 @@ class MulSDCSR(_NoPythonCOp):
             const npy_intp Sb = PyArray_STRIDES({_b})[0];
 
             // loop over columns
+            {omp}
             for (npy_intp j = 0; j < N; ++j)
             {{
                 // extract i-th row of dense matrix
@@ -1414,21 +1511,10 @@ def local_mul_s_d(fgraph, node):
             # mul_s_d_csx don't support that case
             return
 
-        c_data = mul_s_d_csx(
-            sparse.csm_data(svar),
-            sparse.csm_indices(svar),
-            sparse.csm_indptr(svar),
-            dvar,
-        )
+        data, indices, indptr, shape = sparse.csm_properties(svar)
+        c_data = mul_s_d_csx(data, indices, indptr, dvar)
 
-        return [
-            CSx(
-                c_data,
-                sparse.csm_indices(svar),
-                sparse.csm_indptr(svar),
-                sparse.csm_shape(svar),
-            )
-        ]
+        return [CSx(c_data, indices, indptr, shape)]
 
     return False
 
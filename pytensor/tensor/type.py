@@ -250,7 +250,8 @@ class TensorType(CType[np.ndarray], HasDataType, HasShape):
                         )
                         raise TypeError(err_msg)
 
-        if self.ndim != data.ndim:
+        shape = self.shape
+        if len(shape) != data.ndim:
             raise TypeError(
                 f"Wrong number of dimensions: expected {self.ndim},"
                 f" got {data.ndim} with shape {data.shape}."
@@ -261,14 +262,13 @@ class TensorType(CType[np.ndarray], HasDataType, HasShape):
                 " PyTensor C code does not support that.",
             )
 
+        # Plain loop instead of all(<genexpr>), as this runs on every function call
         # zip strict not specified because we are in a hot loop
-        if not all(
-            ds == ts if ts is not None else True
-            for ds, ts in zip(data.shape, self.shape)
-        ):
-            raise TypeError(
-                f"The type's shape ({self.shape}) is not compatible with the data's ({data.shape})"
-            )
+        for ds, ts in zip(data.shape, shape):
+            if ts is not None and ds != ts:
+                raise TypeError(
+                    f"The type's shape ({shape}) is not compatible with the data's ({data.shape})"
+                )
 
         if self.filter_checks_isfinite and not np.all(np.isfinite(data)):
             raise ValueError("Non-finite elements not allowed")
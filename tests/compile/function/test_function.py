@@ -1,4 +1,5 @@
 import pickle
+import re
 import shutil
 import tempfile
 from pathlib import Path
@@ -7,10 +8,19 @@ import numpy as np
 import pytest
 
 from pytensor.compile import shared
-from pytensor.compile.function import function, function_dump
+from pytensor.compile.function import (
+    _compile_cache,
+    function,
+    function_dump,
+    function_load,
+    function_precompile,
+    load_function_dump,
+)
 from pytensor.compile.io import In
 from pytensor.configdefaults import config
 from pytensor.npy_2_compat import UintOverflowError
+from pytensor.tensor.math import exp as pt_exp
+from pytensor.tensor.math import log as pt_log
 from pytensor.tensor.type import (
     bscalar,
     bvector,
@@ -45,12 +55,86 @@ def test_function_dump():
     assert np.allclose(fct1(x), fct2(x))
 
 
+def test_function_dump_out_of_band(tmp_path):
+    v = vector()
+    s = shared(np.arange(1000, dtype=config.floatX))
+    fname = tmp_path / "test_function_dump.pkl"
+    function_dump(fname, [v], v + s, out_of_band=True)
+    assert fname.with_name(fname.name + ".buffers").exists()
+
+    l = load_function_dump(fname)
+    fct = function(**l)
+    x = np.ones(1000, dtype=config.floatX)
+    np.testing.assert_allclose(fct(x), x + np.arange(1000))
+
+
+@pytest.mark.parametrize("out_of_band", [False, True])
+def test_function_precompile(tmp_path, out_of_band):
+    v = vector("v")
+    s = shared(np.arange(5, dtype=config.floatX))
+    out = pt_exp(pt_log(v)) + s
+    fname = tmp_path / "test_function_precompile.pkl"
+    fct1 = function_precompile(fname, [v], out, out_of_band=out_of_band)
+
+    fct2 = function_load(fname)
+    # The graph is loaded already rewritten
+    assert [node.op for node in fct2.maker.fgraph.toposort()] == [
+        node.op for node in fct1.maker.fgraph.toposort()
+    ]
+    x = np.ones(5, dtype=config.floatX)
+    np.testing.assert_allclose(fct2(x), fct1(x))
+
+    with config.change_flags(unpickle_function=False):
+        with pytest.raises(ValueError, match="unpickle_function"):
+            function_load(fname)
+
+
 def test_function_name():
     x = vector("x")
     func = function([x], x + 1.0)
 
     assert __file__ in func.name
 
+    # The name tells where a function that gets a bad input was created
+    with pytest.raises(TypeError, match=re.escape(func.name)):
+        func(np.ones((2, 2)))
+
+
+def test_function_cache():
+    x = dvector("x")
+    y = shared(np.ones(3))
+    out = x + y
+    updates = {y: y + 1}
+
+    with config.change_flags(compile__function_cache_size=1):
+        _compile_cache.clear()
+        f1 = function([x], out, updates=updates)
+        assert list(_compile_cache.values()) == [f1]
+
+        f2 = function([x], out, updates=updates)
+        assert f2 is not f1
+        assert list(_compile_cache.values()) == [f1]
+
+        # Shared variables are still shared between the copies
+        np.testing.assert_allclose(f1([1, 1, 1]), [2, 2, 2])
+        np.testing.assert_allclose(f2([1, 1, 1]), [3, 3, 3])
+        np.testing.assert_allclose(y.get_value(), [3, 3, 3])
+
+        # A different graph is a cache miss and evicts the least recent entry
+        f3 = function([x], x * 2)
+        assert list(_compile_cache.values()) == [f3]
+
+        # Profiled functions bypass the cache
+        function([x], x * 2, profile=True)
+        assert list(_compile_cache.values()) == [f3]
+    _compile_cache.clear()
+
+
+def test_inputs_not_in_list():
+    x = vector("x")
+    with pytest.raises(TypeError, match="contained in a list"):
+        function(x, x + 1.0)
+
 
 def test_trust_input():
     x = dvector()
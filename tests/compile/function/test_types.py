@@ -825,8 +825,8 @@ class TestFunction:
         assert f(2, y=4) == f(2, 4)
         assert f(x=2, y=4) == f(2, 4)
 
-    def test_output_order_sorted(self):
-        # Tests that the output keys are sorted correctly.
+    def test_output_order(self):
+        # Tests that the outputs follow the insertion order of the dict.
 
         x = scalar("x")
         y = scalar("y")
@@ -839,11 +839,12 @@ class TestFunction:
                 [x, y, z, e1, e2], outputs={"x": x, "y": y, "z": z, "1": e1, "2": e2}
             )
 
-        assert "1" in str(f.outputs[0])
-        assert "2" in str(f.outputs[1])
-        assert "x" in str(f.outputs[2])
-        assert "y" in str(f.outputs[3])
-        assert "z" in str(f.outputs[4])
+        assert "x" in str(f.outputs[0])
+        assert "y" in str(f.outputs[1])
+        assert "z" in str(f.outputs[2])
+        assert "1" in str(f.outputs[3])
+        assert "2" in str(f.outputs[4])
+        assert list(f(1, 2, 3, 4, 5)) == ["x", "y", "z", "1", "2"]
 
     def test_composing_function(self):
         # Tests that one can compose two pytensor functions when the outputs are
@@ -890,13 +891,13 @@ class TestFunction:
         # the outputs dictionary.
         x = scalar("x")
 
-        with pytest.raises(AssertionError):
+        with pytest.raises(TypeError):
             function([x], outputs={1.0: x})
 
-        with pytest.raises(AssertionError):
+        with pytest.raises(TypeError):
             function([x], outputs={1.0: x, "a": x**2})
 
-        with pytest.raises(AssertionError):
+        with pytest.raises(TypeError):
             function([x], outputs={(1, "b"): x, 1.0: x**2})
 
     def test_dprint(self):
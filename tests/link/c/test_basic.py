@@ -338,6 +338,39 @@ def test_duallinker_straightforward():
     assert res == 15.3
 
 
+@pytest.mark.skipif(
+    not config.cxx, reason="G++ not available, so we need to skip this test."
+)
+def test_duallinker_check_once():
+    x, y, z = inputs()
+    e = add(mul(x, y), mul(y, z))
+    n_checks = 0
+
+    def checker(x, y):
+        nonlocal n_checks
+        n_checks += 1
+        _my_checker(x, y)
+
+    lnk = DualLinker(checker=checker, check_once=True).accept(
+        FunctionGraph([x, y, z], [e])
+    )
+    fn = make_function(lnk)
+    assert fn(7.2, 1.5, 3.0) == 15.3
+    assert n_checks == 3
+    assert fn(1.0, 2.0, 3.0) == 8.0
+    assert n_checks == 3
+
+    # A mismatch is still caught on the first call
+    e = bad_sub(mul(x, y), mul(y, z))
+    fn = make_function(
+        DualLinker(checker=_my_checker, check_once=True).accept(
+            FunctionGraph([x, y, z], [e])
+        )
+    )
+    with pytest.raises(MyExc):
+        fn(1.0, 2.0, 3.0)
+
+
 @pytest.mark.skipif(
     not config.cxx, reason="G++ not available, so we need to skip this test."
 )
@@ -10,6 +10,18 @@ numba = pytest.importorskip("numba")
 import pytensor.link.numba.dispatch.sparse  # noqa: F401
 from pytensor import config
 from pytensor.sparse import Dot, SparseTensorType
+from pytensor.sparse.basic import (
+    ColScaleCSC,
+    ColScaleCSR,
+    CSMGrad,
+    GetItem2Lists,
+    MulSD,
+    RowScaleCSC,
+    RowScaleCSR,
+    StructuredDotGradCSC,
+    StructuredDotGradCSR,
+)
+from pytensor.tensor.type import ivector, matrix, tensor, vector
 from tests.link.numba.test_basic import compare_numba_and_py
 
 
@@ -101,3 +113,110 @@ def test_sparse_objmode():
         match="Numba will use object mode to run SparseDot's perform method",
     ):
         compare_numba_and_py([x, y], out, [x_val, y_val])
+
+
+@pytest.mark.parametrize("format", ["csr", "csc"])
+@pytest.mark.parametrize("large_sparse_dim", [False, True])
+def test_csm_grad(format, large_sparse_dim):
+    shape = (5, 4)
+    if large_sparse_dim:
+        shape = (5, 5000) if format == "csr" else (5000, 5)
+    x_val = sp.sparse.random(*shape, density=0.5, format=format, dtype=config.floatX)
+    # Gradient with a different, unsorted, sparsity pattern
+    g_val = sp.sparse.random(*shape, density=0.3, format=format, dtype=config.floatX)
+    g_val.indices = g_val.indices[::-1].copy()
+    g_val.data = g_val.data[::-1].copy()
+
+    x_data = vector(dtype=config.floatX)
+    g_data = vector(dtype=config.floatX)
+    indices = [ivector() for _ in range(6)]
+    out = CSMGrad()(x_data, *indices[:3], g_data, *indices[3:])
+
+    compare_numba_and_py(
+        [x_data, *indices[:3], g_data, *indices[3:]],
+        out,
+        [
+            x_val.data,
+            x_val.indices,
+            x_val.indptr,
+            np.array(x_val.shape, dtype="int32"),
+            g_val.data,
+            g_val.indices,
+            g_val.indptr,
+            np.array(g_val.shape, dtype="int32"),
+        ],
+    )
+
+
+@pytest.mark.parametrize(
+    "op, format, s_len",
+    [
+        (ColScaleCSC(), "csc", 4),
+        (RowScaleCSC(), "csc", 5),
+        (ColScaleCSR(), "csr", 4),
+        (RowScaleCSR(), "csr", 5),
+    ],
+)
+def test_scale(op, format, s_len):
+    x = SparseTensorType(format, dtype=config.floatX)()
+    s = vector(dtype=config.floatX)
+    x_val = sp.sparse.random(5, 4, density=0.5, format=format, dtype=config.floatX)
+    s_val = np.arange(1, s_len + 1, dtype=config.floatX)
+
+    def assert_fn(x, y):
+        assert type(x) is type(y)
+        np.testing.assert_allclose(x.toarray(), y.toarray())
+
+    compare_numba_and_py([x, s], op(x, s), [x_val, s_val], assert_fn=assert_fn)
+
+
+@pytest.mark.parametrize("format", ["csr", "csc"])
+def test_get_item_2lists(format):
+    x = SparseTensorType(format, dtype=config.floatX)()
+    ind1 = ivector()
+    ind2 = ivector()
+    x_val = sp.sparse.random(5, 4, density=0.5, format=format, dtype=config.floatX)
+    ind1_val = np.array([0, 4, -1, 2, 2], dtype="int32")
+    ind2_val = np.array([1, 3, 0, -2, 2], dtype="int32")
+
+    compare_numba_and_py(
+        [x, ind1, ind2], GetItem2Lists()(x, ind1, ind2), [x_val, ind1_val, ind2_val]
+    )
+
+
+@pytest.mark.parametrize("format", ["csr", "csc"])
+@pytest.mark.parametrize("y_ndim", [0, 2])
+@pytest.mark.parametrize("y_dtype", ["float64", "int32"])
+def test_mul_s_d(format, y_ndim, y_dtype):
+    x = SparseTensorType(format, dtype="float32")()
+    y = tensor(dtype=y_dtype, shape=(None,) * y_ndim)
+    x_val = sp.sparse.random(5, 4, density=0.5, format=format, dtype="float32")
+    y_val = np.arange(1, 21, dtype=y_dtype).reshape((5, 4))
+    if y_ndim == 0:
+        y_val = y_val[0, 1]
+
+    def assert_fn(x, y):
+        assert type(x) is type(y)
+        assert x.dtype == y.dtype
+        np.testing.assert_allclose(x.toarray(), y.toarray(), rtol=1e-6)
+
+    compare_numba_and_py([x, y], MulSD()(x, y), [x_val, y_val], assert_fn=assert_fn)
+
+
+@pytest.mark.parametrize(
+    "op, format", [(StructuredDotGradCSC(), "csc"), (StructuredDotGradCSR(), "csr")]
+)
+def test_structured_dot_grad(op, format):
+    a_val = sp.sparse.random(5, 4, density=0.5, format=format, dtype=config.floatX)
+    b = matrix(dtype=config.floatX)
+    g_ab = matrix(dtype=config.floatX)
+    indices = ivector()
+    indptr = ivector()
+    b_val = np.random.normal(size=(4, 3)).astype(config.floatX)
+    g_ab_val = np.random.normal(size=(5, 3)).astype(config.floatX)
+
+    compare_numba_and_py(
+        [indices, indptr, b, g_ab],
+        op(indices, indptr, b, g_ab),
+        [a_val.indices, a_val.indptr, b_val, g_ab_val],
+    )
@@ -1,3 +1,6 @@
+import re
+from functools import lru_cache
+
 import numpy as np
 import pytest
 
@@ -5,6 +8,7 @@ import pytensor
 import pytensor.tensor as pt
 import tests.unittest_tools as utt
 from pytensor.compile.mode import Mode
+from pytensor.graph.basic import Constant
 from pytensor.graph.fg import FunctionGraph
 from pytensor.link.c.basic import DualLinker
 from pytensor.scalar.basic import (
@@ -12,6 +16,7 @@ from pytensor.scalar.basic import (
     Composite,
     InRange,
     ScalarType,
+    _composite_c_code_cache,
     add,
     and_,
     arccos,
@@ -34,18 +39,22 @@ from pytensor.scalar.basic import (
     float16,
     float32,
     floats,
+    ge,
+    gt,
     int8,
     int32,
     int64,
     ints,
     invert,
+    le,
     log,
     log1p,
     log2,
     log10,
+    lt,
     mul,
-    neg,
     neq,
+    or_,
     rad2deg,
     reciprocal,
     sin,
@@ -56,11 +65,30 @@ from pytensor.scalar.basic import (
     tanh,
     true_div,
     uint8,
+    xor,
 )
+from pytensor.tensor.elemwise import Elemwise
 from pytensor.tensor.type import fscalar, imatrix, matrix
 from tests.link.test_link import make_function
 
 
+def _allclose_checker(x, y):
+    np.testing.assert_allclose(x[0], y[0], rtol=1e-6)
+
+
+def _dual_function(inputs, outputs):
+    """Compile a function that checks its C code against `perform` on the first call."""
+    linker = DualLinker(checker=_allclose_checker, check_once=True)
+    return make_function(linker.accept(FunctionGraph(inputs, outputs)))
+
+
+@lru_cache(maxsize=1024)
+def _compiled(op, in_dtypes):
+    """Compile `op` applied elementwise to vectors of `in_dtypes`, once per signature."""
+    inputs = [pt.vector(dtype=dtype) for dtype in in_dtypes]
+    return _dual_function(inputs, [Elemwise(op)(*inputs)])
+
+
 def test_mul_add_true():
     x, y, z = floats("xyz")
     e = mul(add(x, y), true_div(x, y))
@@ -126,8 +154,12 @@ class TestComposite:
 
         # Test with multiple outputs
         CC = Composite([x, y, z], [C(x * y, y), C(x * z, y)])
-        # We don't flatten that case.
-        assert isinstance(CC.outputs[0].owner.op, Composite)
+        assert not any(isinstance(node.op, Composite) for node in CC.fgraph.apply_nodes)
+
+        # Test with a Composite that is not at the output
+        CC = Composite([x, y, z], [C(x * y, y) * z, C(x, z)])
+        assert not any(isinstance(node.op, Composite) for node in CC.fgraph.apply_nodes)
+        np.testing.assert_allclose(CC.impl(2.0, 3.0, 4.0), (36.0, 6.0))
 
     @pytest.mark.parametrize("literal_value", (70.0, -np.inf, np.float32("nan")))
     def test_with_constants(self, literal_value):
@@ -157,10 +189,91 @@ class TestComposite:
             (literal_value + test_y) * (test_x / test_y),
         )
 
+    def test_c_code_template_shared(self):
+        x, y = floats("xy")
+        comp_a = Composite([x, y], [mul(add(x, y), 2.0)])
+        comp_a.c_code_template
+
+        x, y = floats("xy")
+        comp_b = Composite([x, y], [mul(add(x, y), 2.0)])
+        comp_c = Composite([x, y], [mul(add(x, y), -2.0)])
+
+        # The template of a structurally identical Composite comes from the cache
+        key = comp_b._c_code_key()
+        assert key in _composite_c_code_cache
+        assert comp_b.c_code_template is comp_a.c_code_template
+        assert comp_b.nodenames == comp_a.nodenames
+
+        assert comp_c._c_code_key() != key
+        assert comp_c.c_code_template != comp_a.c_code_template
+
+        g = FunctionGraph([x, y], comp_b.make_node(x, y).outputs)
+        fn = make_function(DualLinker().accept(g))
+        assert fn(1.0, 2.0) == 6.0
+
+    def test_c_code_template_shared_node_order(self):
+        # The same graph, with its nodes and inputs created in different orders
+        x, y = floats("xy")
+        comp_a = Composite([x, y], [sin(x) + cos(y), cos(y)])
+        y, x = floats("yx")
+        cos_y = cos(y)
+        comp_b = Composite([x, y], [sin(x) + cos_y, cos_y])
+
+        _composite_c_code_cache.clear()
+        comp_a.c_code_template
+        key = comp_b._c_code_key()
+        assert key == comp_a._c_code_key()
+        assert key in _composite_c_code_cache
+
+        # The cached template names the nodes in the order of comp_b's fgraph
+        assert [n.op for n in comp_b.fgraph.toposort()] == [
+            n.op for n in comp_a.fgraph.toposort()
+        ]
+        cached_template = comp_b.c_code_template
+        del comp_b._c_code
+        _composite_c_code_cache.clear()
+        assert comp_b.c_code_template == cached_template
+
+        g = FunctionGraph([x, y], comp_b.make_node(x, y).outputs)
+        fn = make_function(DualLinker().accept(g))
+        np.testing.assert_allclose(fn(1.0, 2.0), [np.sin(1) + np.cos(2), np.cos(2)])
+
+    def test_constant_folding(self):
+        x, y = floats("xy")
+        e = mul(x, add(constant(2.0), constant(3.0))) + y
+        comp_op = Composite([x, y], [e])
+        assert len(comp_op.fgraph.apply_nodes) == 2
+        assert "(5.0)" in comp_op.c_code_template
+        assert comp_op.impl(2.0, 1.0) == 11.0
+
+        # Constant outputs are not folded
+        comp_op = Composite([x], [x + 1, add(constant(2.0), constant(3.0))])
+        assert comp_op.impl(2.0) == (3.0, 5.0)
+
+    def test_constant_folding_float32(self):
+        # Folding follows float32 arithmetic, like the C code, so
+        # 1e8 + 1 - 1e8 is 0 and not 1
+        x = float32("x")
+        big = np.float32(1e8)
+        e = x + add(constant(big), constant(np.float32(1.0)), constant(-big))
+        comp_op = Composite([x], [e])
+        assert len(comp_op.fgraph.apply_nodes) == 1
+        [folded] = [
+            inp
+            for inp in comp_op.fgraph.outputs[0].owner.inputs
+            if isinstance(inp, Constant)
+        ]
+        assert folded.type.dtype == "float32"
+        assert folded.data == 0
+
+        g = FunctionGraph([x], comp_op.make_node(x).outputs)
+        fn = make_function(DualLinker().accept(g))
+        assert fn(np.float32(1.0)) == 1.0
+
     def test_negative_constant(self):
         # Test that a negative constant is wrapped in parentheses to avoid confusing - (unary minus) and -- (decrement)
         x = int64("x")
-        e = neg(constant(-1.5)) % x
+        e = (x - constant(-1.5)) % 2
         comp_op = Composite([x], [e])
         comp_node = comp_op.make_node(x)
 
@@ -195,6 +308,10 @@ class TestComposite:
         fn = make_function(DualLinker().accept(g))
         assert fn(1.0, 2.0, 3.0) == [6.0, 6.0, 0.5]
 
+        # The duplicated output must not be computed twice in the C code
+        declared = re.findall(r"^\w+ V%\(id\)s_tmp\d+;$", C.c_code_template, re.M)
+        assert len(declared) == 3
+
     def test_composite_printing(self):
         x, y, z = floats("xyz")
         e0 = x + y + z
@@ -247,75 +364,53 @@ class TestComposite:
 
 
 class TestLogical:
-    def test_gt(self):
-        x, y, z = floats("xyz")
-        fn = make_function(DualLinker().accept(FunctionGraph([x, y], [x > y])))
-        for a, b in ((3.0, 9), (3, 0.9), (3, 3)):
-            assert fn(a, b) == (a > b)
-
-    def test_lt(self):
-        x, y, z = floats("xyz")
-        fn = make_function(DualLinker().accept(FunctionGraph([x, y], [x < y])))
-        for a, b in ((3.0, 9), (3, 0.9), (3, 3)):
-            assert fn(a, b) == (a < b)
-
-    def test_le(self):
-        x, y, z = floats("xyz")
-        fn = make_function(DualLinker().accept(FunctionGraph([x, y], [x <= y])))
-        for a, b in ((3.0, 9), (3, 0.9), (3, 3)):
-            assert fn(a, b) == (a <= b)
-
-    def test_ge(self):
-        x, y, z = floats("xyz")
-        fn = make_function(DualLinker().accept(FunctionGraph([x, y], [x >= y])))
-        for a, b in ((3.0, 9), (3, 0.9), (3, 3)):
-            assert fn(a, b) == (a >= b)
-
-    def test_eq(self):
-        x, y, z = floats("xyz")
-        fn = make_function(DualLinker().accept(FunctionGraph([x, y], [eq(x, y)])))
-        for a, b in ((3.0, 9), (3, 0.9), (3, 3)):
-            assert fn(a, b) == (a == b)
-
-    def test_neq(self):
-        x, y, z = floats("xyz")
-        fn = make_function(DualLinker().accept(FunctionGraph([x, y], [neq(x, y)])))
-        for a, b in ((3.0, 9), (3, 0.9), (3, 3)):
-            assert fn(a, b) == (a != b)
-
-    def test_or(self):
-        x, y, z = ints("xyz")
-        fn = make_function(DualLinker().accept(FunctionGraph([x, y], [x | y])))
-        for a, b in ((0, 1), (0, 0), (1, 0), (1, 1)):
-            assert fn(a, b) == (a | b), (a, b)
-
-    def test_xor(self):
-        x, y, z = ints("xyz")
-        fn = make_function(DualLinker().accept(FunctionGraph([x, y], [x ^ y])))
-        for a, b in ((0, 1), (0, 0), (1, 0), (1, 1)):
-            assert fn(a, b) == (a ^ b), (a, b)
-
-    def test_and(self):
-        x, y, z = ints("xyz")
-        fn = make_function(DualLinker().accept(FunctionGraph([x, y], [and_(x, y)])))
-        for a, b in ((0, 1), (0, 0), (1, 0), (1, 1)):
-            assert fn(a, b) == (a & b), (a, b)
-
-        x, y, z = ints("xyz")
-        fn = make_function(DualLinker().accept(FunctionGraph([x, y], [x & y])))
-        for a, b in ((0, 1), (0, 0), (1, 0), (1, 1)):
-            assert fn(a, b) == (a & b), (a, b)
+    @pytest.mark.parametrize(
+        "op, ref",
+        [
+            (gt, np.greater),
+            (lt, np.less),
+            (le, np.less_equal),
+            (ge, np.greater_equal),
+            (eq, np.equal),
+            (neq, np.not_equal),
+        ],
+    )
+    def test_comparison(self, op, ref):
+        x, y = pt.dvectors("x", "y")
+        fn = _dual_function([x, y], [Elemwise(op)(x, y)])
+        a = np.array([3.0, 3.0, 3.0])
+        b = np.array([9.0, 0.9, 3.0])
+        np.testing.assert_array_equal(fn(a, b), ref(a, b))
+
+    @pytest.mark.parametrize(
+        "op, ref",
+        [(or_, np.bitwise_or), (xor, np.bitwise_xor), (and_, np.bitwise_and)],
+    )
+    def test_bitwise(self, op, ref):
+        x, y = pt.ivectors("x", "y")
+        fn = _dual_function([x, y], [Elemwise(op)(x, y)])
+        a = np.array([0, 0, 1, 1], dtype="int32")
+        b = np.array([1, 0, 0, 1], dtype="int32")
+        np.testing.assert_array_equal(fn(a, b), ref(a, b))
 
     def test_not(self):
-        x, y, z = ints("xyz")
-        fn = make_function(DualLinker().accept(FunctionGraph([x, y], [invert(x)])))
-        for a, b in ((0, 1), (0, 0), (1, 0), (1, 1)):
-            assert fn(a, b) == ~a, (a,)
+        x = pt.ivector("x")
+        fn = _dual_function([x], [Elemwise(invert)(x)])
+        a = np.array([0, 1], dtype="int32")
+        np.testing.assert_array_equal(fn(a), ~a)
+
+    def test_operators(self):
+        x, y = floats("xy")
+        assert (x > y).owner.op == gt
+        assert (x < y).owner.op == lt
+        assert (x <= y).owner.op == le
+        assert (x >= y).owner.op == ge
 
-        x, y, z = ints("xyz")
-        fn = make_function(DualLinker().accept(FunctionGraph([x, y], [~x])))
-        for a, b in ((0, 1), (0, 0), (1, 0), (1, 1)):
-            assert fn(a, b) == ~a, (a,)
+        x, y = ints("xy")
+        assert (x | y).owner.op == or_
+        assert (x ^ y).owner.op == xor
+        assert (x & y).owner.op == and_
+        assert (~x).owner.op == invert
 
 
 class TestUpgradeToFloat:
@@ -353,78 +448,52 @@ class TestUpgradeToFloat:
     binary_ops_vals = [(arctan2, list(range(-127, 128)), list(range(-127, 128)))]
 
     @staticmethod
-    def _test_unary(unary_op, x_range):
-        xi = int8("xi")
-        xf = float32("xf")
-
-        ei = unary_op(xi)
-        fi = pytensor.function([xi], ei)
-
-        ef = unary_op(xf)
-        ff = pytensor.function([xf], ef)
-
-        for x_val in x_range:
-            outi = fi(x_val)
-            outf = ff(x_val)
-
-            assert outi.dtype == outf.dtype, "incorrect dtype"
-            assert np.allclose(outi, outf), "insufficient precision"
-
-    @staticmethod
-    def _test_binary(binary_op, x_range, y_range):
-        xi = int8("xi")
-        yi = int8("yi")
-        xf = float32("xf")
-        yf = float32("yf")
-
-        ei = binary_op(xi, yi)
-        fi = pytensor.function([xi, yi], ei)
+    def _check(op, float_dtype, *vals):
+        n_in = len(vals)
+        fi = _compiled(op, ("int8",) * n_in)
+        ff = _compiled(op, (float_dtype,) * n_in)
 
-        ef = binary_op(xf, yf)
-        ff = pytensor.function([xf, yf], ef)
+        outi = fi(*(np.asarray(val, dtype="int8") for val in vals))
+        outf = ff(*(np.asarray(val, dtype=float_dtype) for val in vals))
 
-        for x_val in x_range:
-            for y_val in y_range:
-                outi = fi(x_val, y_val)
-                outf = ff(x_val, y_val)
-
-                assert outi.dtype == outf.dtype, "incorrect dtype"
-                assert np.allclose(outi, outf), "insufficient precision"
+        assert outi.dtype == outf.dtype, "incorrect dtype"
+        np.testing.assert_allclose(
+            outi, outf, rtol=1e-5, atol=1e-8, err_msg="insufficient precision"
+        )
 
     def test_true_div(self):
         # true_div's upcast policy is not exactly "upgrade_to_float",
         # so the test is a little bit different
-        x_range = list(range(-127, 128))
-        y_range = list(range(-127, 0)) + list(range(1, 127))
-
-        xi = int8("xi")
-        yi = int8("yi")
-        xf = ScalarType(pytensor.config.floatX)("xf")
-        yf = ScalarType(pytensor.config.floatX)("yf")
-
-        ei = true_div(xi, yi)
-        fi = pytensor.function([xi, yi], ei)
-
-        ef = true_div(xf, yf)
-        ff = pytensor.function([xf, yf], ef)
-
-        for x_val in x_range:
-            for y_val in y_range:
-                outi = fi(x_val, y_val)
-                outf = ff(x_val, y_val)
-
-                assert outi.dtype == outf.dtype, "incorrect dtype"
-                assert np.allclose(outi, outf), "insufficient precision"
+        x_val, y_val = np.meshgrid(
+            list(range(-127, 128)), list(range(-127, 0)) + list(range(1, 127))
+        )
+        self._check(true_div, pytensor.config.floatX, x_val.ravel(), y_val.ravel())
 
-    def test_unary(self):
-        # Automatically define all individual unary tests
-        for unary_op, x_range in self.unary_ops_vals:
-            self._test_unary(unary_op, x_range)
+    @staticmethod
+    @lru_cache
+    def _unary_outputs(dtype):
+        # Evaluate all the unary ops over the whole int8 range in a single
+        # function, each test then looks at the values in its op's domain
+        x = pt.vector("x", dtype=dtype)
+        ops = [op for op, _ in TestUpgradeToFloat.unary_ops_vals]
+        fn = _dual_function([x], [Elemwise(op)(x) for op in ops])
+        return dict(zip(ops, fn(np.arange(-127, 128, dtype=dtype)), strict=True))
+
+    @pytest.mark.parametrize("unary_op, x_range", unary_ops_vals)
+    def test_unary(self, unary_op, x_range):
+        idx = np.asarray(x_range) + 127
+        outi = self._unary_outputs("int8")[unary_op][idx]
+        outf = self._unary_outputs("float32")[unary_op][idx]
+
+        assert outi.dtype == outf.dtype, "incorrect dtype"
+        np.testing.assert_allclose(
+            outi, outf, rtol=1e-5, atol=1e-8, err_msg="insufficient precision"
+        )
 
-    def test_binary(self):
-        # Automatically define all individual binary tests
-        for binary_op, x_range, y_range in self.binary_ops_vals:
-            self._test_binary(binary_op, x_range, y_range)
+    @pytest.mark.parametrize("binary_op, x_range, y_range", binary_ops_vals)
+    def test_binary(self, binary_op, x_range, y_range):
+        x_val, y_val = np.meshgrid(x_range, y_range)
+        self._check(binary_op, "float32", x_val.ravel(), y_val.ravel())
 
 
 def test_mod_complex_fail():
@@ -474,6 +543,19 @@ def test_grad_identity():
     pytensor.gradient.grad(l, x)
 
 
+@pytest.mark.parametrize("openlow, openhi", [(True, True), (False, False)])
+def test_inrange(openlow, openhi):
+    op = InRange(openlow, openhi)
+    assert op != InRange(not openlow, not openhi)
+
+    x, low, high = floats("x", "low", "high")
+    fn = make_function(
+        DualLinker().accept(FunctionGraph([x, low, high], [op(x, low, high)]))
+    )
+    for x_val in (0.0, 1.0, 2.0, 5.0, 6.0):
+        assert fn(x_val, 1.0, 5.0) == op.impl(x_val, 1.0, 5.0)
+
+
 def test_grad_inrange():
     for bound_definition in [(True, True), (False, False)]:
         # Instantiate op, and then take the gradient
@@ -8,6 +8,7 @@ from pytensor.compile import get_default_mode
 from pytensor.scalar import (
     Composite,
     as_scalar,
+    constant,
     cos,
     exp,
     float16,
@@ -48,6 +49,14 @@ def test_single_output(mode):
     np.testing.assert_allclose(fn(4, 3, -1), -1)
 
 
+def test_constants_not_folded():
+    # Constant folding of the inner graph only applies to Composite
+    x0 = float64("x0")
+    const = constant(np.float64(2.0))
+    op = ScalarLoop(init=[x0], update=[x0 + (const + const)])
+    assert len(op.fgraph.apply_nodes) == 2
+
+
 @mode
 def test_multiple_output(mode):
     n_steps = int64("n_steps")
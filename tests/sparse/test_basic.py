@@ -13,6 +13,7 @@ from pytensor.compile.io import In, Out
 from pytensor.configdefaults import config
 from pytensor.gradient import GradientError
 from pytensor.graph.basic import Apply, Constant, applys_between
+from pytensor.graph.fg import FunctionGraph
 from pytensor.graph.op import Op
 from pytensor.sparse import (
     CSC,
@@ -39,9 +40,12 @@ from pytensor.sparse import (
     SparseFromDense,
     SparseTensorType,
     SquareDiagonal,
+    StructuredAddSV,
     StructuredDot,
     StructuredDotGradCSC,
     StructuredDotGradCSR,
+    SubSS,
+    SumDuplicates,
     Transpose,
     TrueDot,
     Usmm,
@@ -55,7 +59,11 @@ from pytensor.sparse import (
     clean,
     construct_sparse_from_list,
     csc_from_dense,
+    csm_data,
+    csm_indices,
+    csm_indptr,
     csm_properties,
+    csm_shape,
     csr_from_dense,
     dense_from_sparse,
     diag,
@@ -74,10 +82,13 @@ from pytensor.sparse import (
     structured_dot,
     structured_maximum,
     structured_minimum,
+    sub,
+    sum_duplicates,
     transpose,
     true_dot,
 )
 from pytensor.sparse.basic import (
+    SparseBlockDiagonal,
     SparseConstant,
     _is_dense_variable,
     _is_sparse,
@@ -415,6 +426,20 @@ class TestTranspose:
         vta = eval_outputs([ta])
         assert vta.shape == (3, 5)
 
+    @pytest.mark.parametrize("format", ["csr", "csc"])
+    def test_perform_view(self, format):
+        # The output aliases the input, which must be declared to the graph
+        x_var = SparseTensorType(format, "float64")()
+        assert transpose(x_var).owner.op.view_map == {0: [0]}
+
+        x = sp.sparse.random(5, 3, density=0.5, format=format)
+        out = [None]
+        Transpose().perform(None, [x], [out])
+        assert out[0].format != format
+        assert np.shares_memory(out[0].data, x.data)
+        assert np.shares_memory(out[0].indices, x.indices)
+        assert np.shares_memory(out[0].indptr, x.indptr)
+
 
 class TestSparseInferShape(utt.InferShapeTester):
     @pytest.mark.skip(reason="infer_shape not implemented for GetItem2d yet")
@@ -694,6 +719,22 @@ class TestConstructSparseFromList:
 
         verify_grad_sparse(fn, [valm])
 
+    @pytest.mark.parametrize("n_idx", [0, 6])
+    def test_perform(self, n_idx):
+        ilist = np.random.default_rng().integers(0, 5, n_idx)
+        values = np.random.random((n_idx, 4)).astype(config.floatX)
+        out = [None]
+        ConstructSparseFromList().perform(
+            None, (np.array([5, 4]), values, ilist), [out]
+        )
+
+        expected = np.zeros((5, 4), dtype=config.floatX)
+        np.add.at(expected, ilist, values)
+        assert out[0].format == "csc"
+        assert out[0].dtype == values.dtype
+        assert out[0].indices.dtype == "int32"
+        utt.assert_allclose(out[0].toarray(), expected)
+
     def test_err(self):
         for ndim in [1, 3]:
             t = TensorType(dtype=config.floatX, shape=(None,) * ndim)()
@@ -721,6 +762,9 @@ class TestAddMul:
     def test_AddDS(self):
         self._testDS(add)
 
+    def test_SubSS(self):
+        self._testSS(sub)
+
     def test_MulSS(self):
         self._testSS(
             mul,
@@ -786,6 +830,11 @@ class TestAddMul:
                     assert np.all(val.todense() == array1 * array2)
                     if dtype1.startswith("float") and dtype2.startswith("float"):
                         verify_grad_sparse(op, [a, b], structured=False)
+                elif op is sub:
+                    assert isinstance(apb.owner.op, SubSS)
+                    assert np.all(val.todense() == array1 - array2)
+                    if dtype1.startswith("float") and dtype2.startswith("float"):
+                        verify_grad_sparse(op, [a, b], structured=False)
 
     def _testSD(
         self,
@@ -1045,6 +1094,14 @@ class TestConversion:
         with pytest.raises(NotScalarConstantError):
             pt.get_underlying_scalar_constant_value(s, only_process_constants=True)
 
+    def test_sparse_from_dense_from_sparse(self):
+        x = SparseTensorType("csr", dtype=config.floatX)()
+        assert csr_from_dense(dense_from_sparse(x)) is x
+
+        y = csc_from_dense(dense_from_sparse(x))
+        assert isinstance(y.owner.op, SparseFromDense)
+        assert y.owner.op.format == "csc"
+
     # TODO:
     # def test_sparse_as_tensor_variable(self):
     #     csr = sp.sparse.csr_matrix(np.eye(3))
@@ -1142,6 +1199,23 @@ class TestCsmProperties:
                 assert np.all(indptr == spmat.indptr)
                 assert np.all(shape == spmat.shape)
 
+    def test_csm_accessors_after_replace(self):
+        # The accessors must build their nodes from the variable they are
+        # given, even after an earlier graph using them was modified in place
+        x = SparseTensorType("csr", dtype="float64")()
+        y = SparseTensorType("csr", dtype="float64")()
+        fg = FunctionGraph([x, y], [csm_data(x) * 2], clone=False)
+        fg.replace(x, y)
+
+        for accessor in (csm_data, csm_indices, csm_indptr, csm_shape):
+            out = accessor(x)
+            assert isinstance(out.owner.op, CSMProperties)
+            assert out.owner.inputs[0] is x
+
+        spmat = sp.sparse.csr_matrix(np.eye(3))
+        f = pytensor.function([x], csm_data(x))
+        np.testing.assert_array_equal(f(spmat), spmat.data)
+
 
 class TestCsm:
     def test_csm_grad(self):
@@ -1247,6 +1321,72 @@ class TestCsm:
                 assert np.all(res.indptr == spmat.indptr)
                 assert np.all(res.shape == spmat.shape)
 
+    @pytest.mark.parametrize("format", ["csc", "csr"])
+    @pytest.mark.parametrize("shape", [(4, 3), (100, 100)])
+    def test_csm_perform(self, format, shape):
+        x = tensor(dtype="float64", shape=(None,))
+        y, z, s = ivector(), ivector(), ivector()
+        f = pytensor.function([x, y, z, s], CSM(format)(x, y, z, s))
+
+        spmat = sp.sparse.random(*shape, density=0.005, format=format, random_state=1)
+        res = f(
+            spmat.data,
+            spmat.indices,
+            spmat.indptr,
+            np.asarray(spmat.shape, "int32"),
+        )
+        assert type(res) is type(spmat)
+        assert res.shape == spmat.shape
+        assert res.has_sorted_indices
+        assert np.all(res.indices == spmat.indices)
+        assert np.all(res.indptr == spmat.indptr)
+        assert np.all(res.toarray() == spmat.toarray())
+        assert "stored elements" in repr(res)
+
+        # The input arrays are not shared with the output
+        indices = spmat.indices.astype("int32")
+        res = f(spmat.data, indices, spmat.indptr, np.asarray(spmat.shape, "int32"))
+        assert not np.shares_memory(res.indices, indices)
+
+    @pytest.mark.parametrize("g_density", [0.0, 0.01, 0.5])
+    def test_csm_grad_perform(self, g_density):
+        x = sp.sparse.random(20, 300, density=0.2, format="csr", random_state=1)
+        g = sp.sparse.random(20, 300, density=g_density, format="csr", random_state=2)
+
+        inputs = [
+            vector(dtype="float64"),
+            ivector(),
+            ivector(),
+            ivector(),
+            vector(dtype="float64"),
+            ivector(),
+            ivector(),
+            ivector(),
+        ]
+        f = pytensor.function(inputs, CSMGrad()(*inputs))
+        res = f(
+            x.data,
+            x.indices,
+            x.indptr,
+            np.asarray(x.shape, "int32"),
+            g.data,
+            g.indices,
+            g.indptr,
+            np.asarray(g.shape, "int32"),
+        )
+
+        x_rows = np.repeat(np.arange(x.shape[0]), np.diff(x.indptr))
+        utt.assert_allclose(res, g.toarray()[x_rows, x.indices])
+
+    def test_csm_constant_int32_inputs(self):
+        x = vector()
+        out = CSM("csr")(x, np.array([0, 1], dtype="int64"), [0, 1, 2], (2, 2))
+        for inp in out.owner.inputs[1:]:
+            assert inp.dtype == "int32"
+
+        with pytest.raises(TypeError, match="indices must be representable as int32"):
+            CSM("csr")(x, np.array([0, 2**40]), [0, 1, 2], (2, 2))
+
 
 class TestStructuredDot:
     def test_structureddot_csc_grad(self):
@@ -1279,6 +1419,68 @@ class TestStructuredDot:
 
         verify_grad_sparse(buildgraph_T, [spmat, mat], structured=True)
 
+    @pytest.mark.parametrize("format", ["csc", "csr"])
+    def test_structured_dot_grad_graph(self, format):
+        # The gradient reuses a single CSMProperties node of the sparse input
+        x = SparseTensorType(format, dtype="float64")()
+        y = matrix(dtype="float64")
+        g_x = pytensor.grad(structured_dot(x, y).sum(), x)
+        nodes = {
+            node
+            for node in applys_between([x, y], [g_x])
+            if isinstance(node.op, CSMProperties)
+        }
+        assert len(nodes) == 1
+
+    @pytest.mark.parametrize(
+        "format, op", [("csc", StructuredDotGradCSC), ("csr", StructuredDotGradCSR)]
+    )
+    def test_structured_dot_grad_perform(self, format, op):
+        spmat = sp.sparse.random(5, 4, density=0.4, format=format, random_state=1)
+        mat = np.random.standard_normal((4, 3))
+        g_ab = np.random.standard_normal((5, 3))
+
+        if format == "csc":
+            rows, cols = spmat.indices, np.repeat(np.arange(4), np.diff(spmat.indptr))
+        else:
+            rows, cols = np.repeat(np.arange(5), np.diff(spmat.indptr)), spmat.indices
+        expected = (g_ab @ mat.T)[rows, cols]
+
+        for b, g in [(mat, g_ab), (sp.sparse.csr_matrix(mat), g_ab)]:
+            out = [None]
+            op().perform(None, (spmat.indices, spmat.indptr, b, g), [out])
+            utt.assert_allclose(out[0], expected)
+
+    @pytest.mark.skipif(not config.cxx, reason="No cxx compiler")
+    @pytest.mark.parametrize(
+        "format, op", [("csc", StructuredDotGradCSC), ("csr", StructuredDotGradCSR)]
+    )
+    @pytest.mark.parametrize("contiguous", [True, False])
+    @pytest.mark.parametrize("openmp", [False, True])
+    def test_structured_dot_grad_c_code(self, format, op, contiguous, openmp):
+        spmat = sp.sparse.random(5, 4, density=0.4, format=format, random_state=1)
+        # An odd number of columns exercises the tail of the unrolled loop
+        mat = np.random.standard_normal((4, 7))
+        g_ab = np.random.standard_normal((5, 7))
+        if not contiguous:
+            mat = np.asfortranarray(mat)
+
+        indices, indptr = pt.ivector(), pt.ivector()
+        b, g = pt.dmatrix(), pt.dmatrix()
+        with config.change_flags(openmp_elemwise_minsize=1):
+            f = function(
+                [indices, indptr, b, g],
+                op(openmp=openmp)(indices, indptr, b, g),
+                mode=pytensor.compile.mode.Mode(linker="c", optimizer=None),
+            )
+        # Ops with and without OpenMP compile to different code
+        assert op(openmp=openmp) == op(openmp=openmp)
+        assert op(openmp=openmp) != op(openmp=not openmp)
+
+        expected = [None]
+        op().perform(None, (spmat.indices, spmat.indptr, mat, g_ab), [expected])
+        utt.assert_allclose(f(spmat.indices, spmat.indptr, mat, g_ab), expected[0])
+
     def test_upcast(self):
         typenames = (
             "float32",
@@ -1872,6 +2074,26 @@ class TestUsmm:
                 isinstance(node.op, Dot | Usmm | UsmmCscDense) for node in topo
             )
 
+    @pytest.mark.parametrize("density", [0.002, 0.5])
+    def test_perform_sparse_sparse(self, density):
+        x = sp.sparse.random(10, 40, density=density, format="csr", random_state=1)
+        y = sp.sparse.random(40, 20, density=density, format="csc", random_state=2)
+        z = self.z[:, :20].astype("float32")
+        alpha = np.asarray(1.5)
+        op = Usmm()
+        node = op.make_node(
+            scalar(),
+            sparse.csr_dmatrix(),
+            sparse.csc_dmatrix(),
+            matrix(dtype="float32"),
+        )
+
+        out = [None]
+        op.perform(node, (alpha, x, y, z), [out])
+        assert out[0].dtype == "float64"
+        utt.assert_allclose(out[0], 1.5 * (x @ y).toarray() + z)
+        assert not np.shares_memory(out[0], z)
+
 
 class TestZerosLike:
     def test(self):
@@ -1888,6 +2110,23 @@ class TestZerosLike:
         assert fx.nnz == 0
         assert fx.shape == vx.shape
 
+    @pytest.mark.parametrize("format", ["csc", "csr"])
+    def test_constant(self, format):
+        x_val = sp.sparse.random(5, 4, density=0.5, format=format, random_state=1)
+        x = as_sparse_variable(x_val)
+
+        zeros = sparse.sp_zeros_like(x)
+        assert isinstance(zeros, SparseConstant)
+        assert zeros.type == x.type
+        assert zeros.data.nnz == 0
+        assert zeros.data.shape == x_val.shape
+
+        ones = sparse.sp_ones_like(x)
+        assert isinstance(ones, SparseConstant)
+        assert ones.type == x.type
+        assert np.all(ones.data.toarray() == (x_val.toarray() != 0))
+        assert not np.shares_memory(ones.data.indices, x_val.indices)
+
 
 def test_shape_i():
     sparse_dtype = "float32"
@@ -1903,6 +2142,9 @@ def test_shape():
     sparse_dtype = "float32"
 
     a = SparseTensorType("csr", dtype=sparse_dtype)()
+    assert not any(
+        isinstance(node.op, DenseFromSparse) for node in applys_between([a], [a.shape])
+    )
     f = pytensor.function([a], a.shape)
     assert np.all(
         f(sp.sparse.csr_matrix(random_lil((100, 10), sparse_dtype, 3))) == (100, 10)
@@ -1979,6 +2221,29 @@ def test_sparse_shared_memory():
     assert (result_.todense() == result.todense()).all()
 
 
+@pytest.mark.parametrize("format", ["csc", "csr"])
+def test_sparse_constant_signature(format):
+    a = sp.sparse.random(5, 4, density=0.5, format=format, random_state=1)
+    b = a.copy()
+    assert as_sparse_variable(a).signature() == as_sparse_variable(b).signature()
+
+    # Same sparsity pattern, different values
+    b.data[0] += 1
+    assert as_sparse_variable(a).signature() != as_sparse_variable(b).signature()
+
+    # Same values, different sparsity pattern
+    c = a.tolil()
+    c[0, 0] = 0 if c[0, 0] else 1
+    c = c.asformat(format)
+    assert as_sparse_variable(a).signature() != as_sparse_variable(c).signature()
+
+    # Signatures with different shapes don't share a hash
+    d = sp.sparse.random(4, 5, density=0.5, format=format, random_state=1)
+    assert hash(as_sparse_variable(a).signature()) != hash(
+        as_sparse_variable(d).signature()
+    )
+
+
 def test_size():
     # Ensure the `size` attribute of sparse matrices behaves as in numpy.
 
@@ -1999,6 +2264,13 @@ def test_size():
         check()
 
 
+def test_size_constant():
+    y = sp.sparse.csr_matrix(np.array([[1.0, 0.0], [0.0, 2.0]]))
+    y_size = as_sparse_variable(y).size
+    assert isinstance(y_size, Constant)
+    assert y_size.data == y.size
+
+
 class TestColScaleCSC(utt.InferShapeTester):
     def setup_method(self):
         super().setup_method()
@@ -2020,7 +2292,7 @@ class TestColScaleCSC(utt.InferShapeTester):
             utt.assert_allclose(expected, tested.toarray())
 
     def test_infer_shape(self):
-        for format, cls in [("csc", sparse.ColScaleCSC), ("csr", sparse.RowScaleCSC)]:
+        for format, cls in [("csc", sparse.ColScaleCSC), ("csr", sparse.ColScaleCSR)]:
             variable, data = sparse_random_inputs(format, shape=(8, 10))
             variable.append(vector())
             data.append(np.random.random(10).astype(config.floatX))
@@ -2057,7 +2329,7 @@ class TestRowScaleCSC(utt.InferShapeTester):
             utt.assert_allclose(expected, tested.toarray())
 
     def test_infer_shape(self):
-        for format, cls in [("csc", sparse.RowScaleCSC), ("csr", sparse.ColScaleCSC)]:
+        for format, cls in [("csc", sparse.RowScaleCSC), ("csr", sparse.RowScaleCSR)]:
             variable, data = sparse_random_inputs(format, shape=(8, 10))
             variable.append(vector())
             data.append(np.random.random(8).astype(config.floatX))
@@ -2102,6 +2374,40 @@ class TestSpSum(utt.InferShapeTester):
                 expected = data[0].todense().sum(axis).ravel()
                 utt.assert_allclose(expected, tested)
 
+    @pytest.mark.parametrize("format", ["csc", "csr"])
+    @pytest.mark.parametrize("axis", [None, 0, 1])
+    def test_op_empty_segments(self, format, axis):
+        x = sparse.matrix(format, dtype="float64")
+        f = pytensor.function([x], self.op(x, axis=axis))
+
+        x_val = np.zeros((4, 5))
+        x_val[1, 2] = 1.0
+        x_val[1, 4] = 2.0
+        x_val[3, 0] = 3.0
+        tested = f(sp.sparse.csr_matrix(x_val).asformat(format))
+        utt.assert_allclose(x_val.sum(axis), tested)
+
+        empty = sp.sparse.csr_matrix((4, 5)).asformat(format)
+        utt.assert_allclose(np.zeros((4, 5)).sum(axis), f(empty))
+
+    @pytest.mark.parametrize("format", ["csc", "csr"])
+    @pytest.mark.parametrize("axis", [None, 0, 1])
+    @pytest.mark.parametrize("dtype", ["int8", "uint8", "int16"])
+    def test_op_small_dtypes(self, format, axis, dtype):
+        x = sparse.matrix(format, dtype=dtype)
+        f = pytensor.function([x], self.op(x, axis=axis))
+
+        x_val = np.zeros((3, 4), dtype=dtype)
+        x_val[1, :] = 100
+        x_val[2, 1:3] = 1
+        tested = f(sp.sparse.csr_matrix(x_val).asformat(format))
+        assert tested.dtype == dtype
+        np.testing.assert_array_equal(tested, x_val.sum(axis).astype(dtype))
+
+    def test_invalid_format(self):
+        with pytest.raises(NotImplementedError, match="bsr"):
+            self.op(sparse.bsr_fmatrix())
+
     def test_infer_shape(self):
         for format in sparse.sparse_formats:
             for axis in self.possible_axis:
@@ -2209,6 +2515,26 @@ class TestEnsureSortedIndices(utt.InferShapeTester):
 
                 utt.assert_allclose(expected, tested)
 
+    @pytest.mark.parametrize("inplace", [False, True])
+    def test_perform(self, inplace):
+        op = EnsureSortedIndices(inplace=inplace)
+        x = sp.sparse.csr_matrix(
+            (np.array([1.0, 2.0, 3.0]), np.array([2, 0, 1]), np.array([0, 2, 3])),
+            shape=(2, 3),
+        )
+        x.has_sorted_indices = False
+        expected = x.toarray()
+        out = [None]
+        op.perform(None, [x], [out])
+        assert out[0].has_sorted_indices
+        assert np.array_equal(out[0].indices, [0, 2, 1])
+        assert np.array_equal(out[0].toarray(), expected)
+        assert (out[0] is x) == inplace
+
+        # Already sorted inputs are passed through
+        op.perform(None, [out[0]], [out])
+        assert out[0].has_sorted_indices
+
     def test_infer_shape(self):
         for format in sparse.sparse_formats:
             for shape in zip(range(5, 9), range(3, 7)[::-1], strict=True):
@@ -2224,6 +2550,39 @@ class TestEnsureSortedIndices(utt.InferShapeTester):
                 verify_grad_sparse(self.op, data, structured=False)
 
 
+class TestSumDuplicates(utt.InferShapeTester):
+    def test_perform(self):
+        x = sp.sparse.csr_matrix(
+            (np.array([1.0, 2.0, 3.0]), np.array([1, 1, 0]), np.array([0, 2, 3])),
+            shape=(2, 3),
+        )
+        expected = x.toarray()
+        out = [None]
+        SumDuplicates().perform(None, [x], [out])
+        assert out[0].has_canonical_format
+        assert out[0].nnz == 2
+        assert np.array_equal(out[0].toarray(), expected)
+        # The input is not modified
+        assert x.nnz == 3
+
+        # Canonical inputs are passed through
+        y = out[0]
+        SumDuplicates().perform(None, [y], [out])
+        assert out[0] is y
+
+    def test_infer_shape(self):
+        for format in sparse.sparse_formats:
+            variable, data = sparse_random_inputs(format, shape=(5, 3))
+            self._compile_and_check(
+                variable, [sum_duplicates(*variable)], data, SumDuplicates
+            )
+
+    def test_grad(self):
+        for format in sparse.sparse_formats:
+            variable, data = sparse_random_inputs(format, shape=(5, 3))
+            verify_grad_sparse(sum_duplicates, data, structured=False)
+
+
 class TestClean(utt.InferShapeTester):
     def setup_method(self):
         super().setup_method()
@@ -2370,18 +2729,17 @@ class TestGetItem:
         with pytest.raises(IndexError):
             f(A[0])
 
-    def test_get_item_list_grad(self):
+    @pytest.mark.parametrize("format", ["csr", "csc"])
+    @pytest.mark.parametrize("index", [[0, 1], [3, 1, -1, 0]])
+    def test_get_item_list_grad(self, format, index):
         op = sparse.basic.GetItemList()
 
         def op_with_fixed_index(x):
-            return op(x, index=np.asarray([0, 1]))
+            return op(x, index=np.asarray(index))
 
-        x, x_val = sparse_random_inputs("csr", (4, 5))
+        x, x_val = sparse_random_inputs(format, (4, 5))
 
-        try:
-            verify_grad_sparse(op_with_fixed_index, x_val)
-        except NotImplementedError as e:
-            assert "Scipy version is to old" in str(e)
+        verify_grad_sparse(op_with_fixed_index, x_val)
 
     def test_GetItem2Lists(self):
         a, A = sparse_random_inputs("csr", (4, 5))
@@ -2414,13 +2772,17 @@ class TestGetItem:
         with pytest.raises(IndexError):
             f2(A[0])
 
-    def test_get_item_2lists_grad(self):
+    @pytest.mark.parametrize("format", ["csr", "csc"])
+    @pytest.mark.parametrize(
+        "ind1, ind2", [([0, 1], [2, 3]), ([0, 1, -3, 3], [2, 3, 3, -1])]
+    )
+    def test_get_item_2lists_grad(self, format, ind1, ind2):
         op = sparse.basic.GetItem2Lists()
 
         def op_with_fixed_index(x):
-            return op(x, ind1=np.asarray([0, 1]), ind2=np.asarray([2, 3]))
+            return op(x, ind1=np.asarray(ind1), ind2=np.asarray(ind2))
 
-        x, x_val = sparse_random_inputs("csr", (4, 5))
+        x, x_val = sparse_random_inputs(format, (4, 5))
 
         verify_grad_sparse(op_with_fixed_index, x_val)
 
@@ -2664,6 +3026,19 @@ class TestCasting(utt.InferShapeTester):
                     utt.assert_allclose(expected, t_cls)
                     utt.assert_allclose(expected, t_prop)
 
+    def test_cast_view(self):
+        x = SparseTensorType("csr", dtype="float64")()
+        node = Cast("float32")(x).owner
+        assert node.op.view_map == {0: [0]}
+
+        x_val = sp.sparse.random(4, 5, density=0.5, format="csr", random_state=1)
+        out = [None]
+        node.op.perform(node, [x_val], [out])
+        assert out[0].dtype == "float32"
+        assert np.shares_memory(out[0].indices, x_val.indices)
+        assert np.shares_memory(out[0].indptr, x_val.indptr)
+        utt.assert_allclose(out[0].toarray(), x_val.toarray().astype("float32"))
+
     @pytest.mark.slow
     def test_infer_shape(self):
         for format in sparse.sparse_formats:
@@ -3244,6 +3619,27 @@ class TestStructuredAddSV:
                     as_ndarray(spones.multiply(spmat + mat)), out.toarray()
                 )
 
+    @pytest.mark.parametrize("format", ["csr", "csc"])
+    def test_perform_non_canonical(self, format):
+        # Duplicate entries are summed and explicit zeros are left alone
+        sp_types = {"csc": sp.sparse.csc_matrix, "csr": sp.sparse.csr_matrix}
+        spmat = sp_types[format](
+            (
+                np.array([1.0, 2.0, 0.0, 3.0]),
+                np.array([1, 1, 0, 2]),
+                np.array([0, 2, 3, 4]),
+            ),
+            shape=(3, 3),
+        )
+        assert not spmat.has_canonical_format
+        vec = np.array([10.0, 20.0, 30.0])
+        expected = spmat.toarray()
+        expected += (expected != 0) * vec
+
+        out = [None]
+        StructuredAddSV().perform(None, [spmat, vec], [out])
+        utt.assert_allclose(expected, out[0].toarray())
+
 
 class TestTrueDot(utt.InferShapeTester):
     def setup_method(self):
@@ -3364,6 +3760,22 @@ class TestSamplingDot(utt.InferShapeTester):
         assert tested.format == "csr"
         assert tested.dtype == expected.dtype
 
+    @pytest.mark.parametrize("format", ["csr", "csc"])
+    def test_perform_sparse_pattern(self, format):
+        rng = np.random.default_rng()
+        x = rng.standard_normal((40, 3)).astype("float32")
+        y = rng.standard_normal((30, 3))
+        # Sparse enough to only compute the sampled elements
+        p = sp.sparse.random(40, 30, density=0.01, format=format, random_state=1)
+
+        out = [None]
+        SamplingDot().perform(None, (x, y, p), [out])
+        expected = p.multiply(np.dot(x, y.T))
+
+        utt.assert_allclose(as_ndarray(expected), out[0].toarray())
+        assert out[0].format == format
+        assert out[0].dtype == expected.dtype
+
     def test_infer_shape(self):
         self._compile_and_check(
             self.x,
@@ -3416,3 +3828,21 @@ def test_block_diagonal(format, sparse_input):
 
     assert isinstance(result.eval(), type(sp_result))
     np.testing.assert_allclose(result.eval().toarray(), sp_result.toarray())
+
+
+@pytest.mark.parametrize("format", ["csc", "csr"], ids=["csc", "csr"])
+@pytest.mark.parametrize("input_format", ["csc", "csr", "dense"])
+def test_block_diagonal_single_input(format, input_format):
+    A = np.array([[1, 2], [3, 4]], dtype=config.floatX)
+    if input_format != "dense":
+        A = sp.sparse.csr_matrix(A).asformat(input_format)
+
+    result = block_diag(A, format=format)
+    if input_format == format:
+        assert result.owner is None
+    else:
+        assert isinstance(result.owner.op, SparseBlockDiagonal)
+
+    value = result.eval()
+    assert value.format == format
+    np.testing.assert_allclose(value.toarray(), [[1, 2], [3, 4]])
@@ -3,11 +3,16 @@ import pytest
 import scipy as sp
 
 import pytensor
+import pytensor.scalar as ps
 from pytensor import sparse
 from pytensor.compile.mode import Mode, get_default_mode
 from pytensor.configdefaults import config
-from pytensor.sparse.rewriting import SamplingDotCSR, sd_csc
+from pytensor.sparse.rewriting import MulSDCSC, MulSDCSR, SamplingDotCSR, sd_csc
 from pytensor.tensor.basic import as_tensor_variable
+from pytensor.tensor.elemwise import Elemwise
+from pytensor.tensor.math import exp as pt_exp
+from pytensor.tensor.math import sqr as pt_sqr
+from pytensor.tensor.math import sqrt as pt_sqrt
 from pytensor.tensor.math import sum as pt_sum
 from pytensor.tensor.type import ivector, matrix, vector
 from tests import unittest_tools as utt
@@ -160,6 +165,85 @@ def test_local_dense_from_sparse_sparse_from_dense():
         f([[1, 2], [3, 4]])
 
 
+@pytest.mark.parametrize("format", ["csc", "csr"])
+def test_local_zero_preserving_elemwise_dense_from_sparse(format):
+    mode = get_default_mode().including(
+        "local_zero_preserving_elemwise_dense_from_sparse"
+    )
+
+    x = sparse.matrix(format, dtype="float64")
+    out = pt_sqrt(sparse.dense_from_sparse(x))
+    f = pytensor.function([x], out, mode=mode)
+
+    sqrt_node = next(
+        node
+        for node in f.maker.fgraph.apply_nodes
+        if isinstance(node.op, Elemwise) and isinstance(node.op.scalar_op, ps.Sqrt)
+    )
+    assert sqrt_node.inputs[0].type.ndim == 1
+
+    x_val = sp.sparse.random(4, 5, density=0.5, format=format, random_state=1)
+    np.testing.assert_allclose(f(x_val), np.sqrt(x_val.toarray()))
+
+    # Non zero-preserving operations are left alone
+    out = pt_exp(sparse.dense_from_sparse(x))
+    f = pytensor.function([x], out, mode=mode)
+    assert not any(
+        isinstance(node.op, sparse.CSM) for node in f.maker.fgraph.apply_nodes
+    )
+    np.testing.assert_allclose(f(x_val), np.exp(x_val.toarray()))
+
+
+@pytest.mark.parametrize("format", ["csc", "csr"])
+def test_local_zero_preserving_elemwise_dense_from_sparse_duplicates(format):
+    mode = get_default_mode().including(
+        "local_zero_preserving_elemwise_dense_from_sparse"
+    )
+
+    x = sparse.matrix(format, dtype="float64")
+    f = pytensor.function([x], pt_sqr(sparse.dense_from_sparse(x)), mode=mode)
+    assert any(isinstance(node.op, sparse.CSM) for node in f.maker.fgraph.apply_nodes)
+
+    # Non-canonical input, with two entries stored for element (0, 0)
+    cls = sp.sparse.csr_matrix if format == "csr" else sp.sparse.csc_matrix
+    x_val = cls(
+        (np.array([1.0, 2.0, 4.0]), np.array([0, 0, 1]), np.array([0, 2, 3])),
+        shape=(2, 2),
+    )
+    assert not x_val.has_canonical_format
+    np.testing.assert_allclose(f(x_val), x_val.toarray() ** 2)
+    # The input is left untouched
+    assert x_val.nnz == 3
+
+
+@pytest.mark.parametrize(
+    "op, diag_first",
+    [
+        (sparse.dot, True),
+        (sparse.dot, False),
+        # `structured_dot` only takes a sparse first input
+        (sparse.structured_dot, True),
+    ],
+)
+def test_local_dot_square_diagonal(op, diag_first):
+    mode = get_default_mode().including("local_dot_square_diagonal")
+
+    d = vector("d", dtype="float64")
+    y = matrix("y", dtype="float64")
+    x = sparse.square_diagonal(d)
+    out = op(x, y) if diag_first else op(y, x)
+    f = pytensor.function([d, y], out, mode=mode)
+    assert not any(
+        isinstance(node.op, sparse.SquareDiagonal)
+        for node in f.maker.fgraph.apply_nodes
+    )
+
+    d_val = np.arange(1.0, 4.0)
+    y_val = np.random.random((3, 3))
+    expected = np.diag(d_val) @ y_val if diag_first else y_val @ np.diag(d_val)
+    np.testing.assert_allclose(f(d_val, y_val), expected)
+
+
 def test_sd_csc():
     A = sp.sparse.random(4, 5, density=0.60, format="csc", dtype=np.float32)
     b = np.random.random((5, 2)).astype(np.float32)
@@ -174,3 +258,25 @@ def test_sd_csc():
     res = sd_csc(a_val, a_ind, a_ptr, nrows, b).eval()
 
     utt.assert_allclose(res, target)
+
+
+@pytest.mark.skipif(
+    not pytensor.config.cxx, reason="G++ not available, so we need to skip this test."
+)
+@pytest.mark.parametrize("openmp", [False, True])
+@pytest.mark.parametrize("format", ["csc", "csr"])
+def test_mul_s_d_csx(format, openmp):
+    op = {"csc": MulSDCSC, "csr": MulSDCSR}[format](openmp=openmp)
+    A = sp.sparse.random(40, 30, density=0.5, format=format, dtype="float64")
+    b = np.random.random((40, 30))
+
+    with config.change_flags(openmp_elemwise_minsize=1):
+        res = op(
+            as_tensor_variable(A.data),
+            as_tensor_variable(A.indices),
+            as_tensor_variable(A.indptr),
+            as_tensor_variable(b),
+        ).eval(mode=Mode(linker="c"))
+
+    coo = A.tocoo()
+    utt.assert_allclose(res, A.data * b[coo.row, coo.col])